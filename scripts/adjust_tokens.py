@@ -36,6 +36,7 @@ def retokenize(input_data) -> Document:
                 # set the preposition to point to the article
                 tok.head = new_tok.id
 
+                new_tok.sentence = sent
                 sent.tokens.insert(i + 1, new_tok)
                 # remember where new tokens were added!
                 # -> all head references afterwards must be updated!
@@ -50,6 +51,7 @@ def retokenize(input_data) -> Document:
                 for new_tok_index in new_tok_locations:
                     if int(tok.head) > new_tok_index:
                         tok.head = str(int(tok.head) + 1)
+        sent.invalidate_dependencies()
 
     return doc
 
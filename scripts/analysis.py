@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import argparse
+import json
 from pathlib import Path
 
 import matplotlib.pyplot as plt
@@ -8,6 +9,9 @@ import pandas as pd
 import seaborn as sns
 import numpy as np
 
+from common import parse_cpus
+from timing_store import load_timing
+
 # Paths that shouldn't change
 SYSTEMS_DIR = Path("../data/system")
 GOLD_DIR = Path("../data/gold")
@@ -93,7 +97,7 @@ if __name__ == "__main__":
 
     # be careful about what subdirs are in SYSTEMS_DIR!
     # unexpected subdirs can cause unexpected behaviors, missing cols, etc.
-    all_systems = list(p.name for p in SYSTEMS_DIR.iterdir())
+    all_systems = list(p.name for p in SYSTEMS_DIR.iterdir() if p.is_dir())
     all_anno_levels = ["tokens", "sentences", "pos", "morph", "lemmas", "depparse"]
 
     argparser = argparse.ArgumentParser()
@@ -205,20 +209,7 @@ if __name__ == "__main__":
 
         # 2. make timing table for each annotation level
 
-        timing = pd.read_csv(
-            "../eval/timing.csv",
-            sep="\t",
-            header=None,
-            names=[
-                "system",
-                "domain",
-                "annotation",
-                "model_load_time",
-                "run_time",
-                "process_time",
-                "exp_exec_time",
-            ],
-        )
+        timing = load_timing()
 
         #  old (unbalanced) data
         # text_lengths = {
@@ -236,9 +227,11 @@ if __name__ == "__main__":
             "opensubtitles": 1514,
         }
         timing["num_tokens"] = timing.domain.apply(lambda x: text_lengths.get(x))
-        timing["secs_per_1ktoken"] = (timing.process_time / timing.num_tokens) * 1000
+        # CPU time of helper processes (CoreNLP server, TreeTagger, ...)
+        # counts towards the cost of the system, older rows lack it
+        timing["cpu_time"] = timing.process_time + timing.run_children_process_time.fillna(0)
+        timing["secs_per_1ktoken"] = (timing.cpu_time / timing.num_tokens) * 1000
 
-        # timing_levels = ["tokens", "pos", "lemmas", "depparse"]
         # for level in timing_levels:
         #     print(f"Table for {level}", file=outfile)
         #     grouped = (
@@ -248,24 +241,38 @@ if __name__ == "__main__":
         #         .rename(index=system_name_fmt)
         #     )
         #     print(grouped.to_latex(escape=False), file=outfile)
-        xtab_time = pd.crosstab(
-            timing.system,
-            timing.annotation,
-            values=timing.secs_per_1ktoken,
-            aggfunc="mean",
+        # repeated runs (`--repeat`) give several samples per system and
+        # file: show the median with its interquartile range
+        timing_levels = ["tokens", "pos", "lemmas", "depparse"]
+        level_names = {
+            "tokens": "Tokenization",
+            "lemmas": "Lemmas",
+            "pos": "Word-Level",
+            "depparse": "Dependencies",
+        }
+        grouped = timing.groupby(["system", "annotation"]).secs_per_1ktoken
+        time_stats = pd.DataFrame(
+            {
+                "median": grouped.median(),
+                "q1": grouped.quantile(0.25),
+                "q3": grouped.quantile(0.75),
+                "min": grouped.min(),
+            }
+        )
+        xtab_time = time_stats["median"].unstack()[timing_levels]
+        xtab_band = (
+            time_stats.apply(
+                lambda row: f"{row['median']:.2f}\n[{row.q1:.2f}, {row.q3:.2f}]", axis=1
+            )
+            .unstack()[timing_levels]
+            .fillna("")
         )
         plt.figure()
         time_plot = sns.heatmap(
-            xtab_time[["tokens", "pos", "lemmas", "depparse"]].rename(
-                index=system_name_fmt,
-                columns={
-                    "tokens": "Tokenization",
-                    "lemmas": "Lemmas",
-                    "pos": "Word-Level",
-                    "depparse": "Dependencies",
-                },
-            ),
-            annot=True,
+            xtab_time.rename(index=system_name_fmt, columns=level_names),
+            annot=xtab_band.values,
+            fmt="",
+            annot_kws={"fontsize": 6},
             cmap=sns.color_palette("coolwarm", 100),
             robust=True,
         )
@@ -276,6 +283,48 @@ if __name__ == "__main__":
         time_fig.set_tight_layout(True)
         time_fig.savefig("../eval/timingplot.png", dpi=400)
 
+        print("Secs per 1k tokens (median, IQR, min)", file=outfile)
+        print(
+            time_stats.assign(iqr=time_stats.q3 - time_stats.q1)[["median", "iqr", "min"]]
+            .rename(index=system_name_fmt, level=0)
+            .to_latex(float_format="%.3f"),
+            file=outfile,
+        )
+
+        # wall time per phase (only recorded for newer runs):
+        # is a system slow in its model or in our glue code?
+        phase_cols = ["model_load_time", "run_time", "postprocess_time", "write_time"]
+        phases = timing.dropna(subset=["postprocess_time"])
+        if not phases.empty:
+            print("Phase timing (secs, median per file)", file=outfile)
+            print(
+                phases.groupby(["annotation", "system"])[phase_cols]
+                .median()
+                .to_latex(float_format="%.4f"),
+                file=outfile,
+            )
+
+        # single-core efficiency vs. multi-core scaling (`--cpus`,
+        # `--threads`; only recorded for newer runs)
+        settings = timing.dropna(subset=["cpu_affinity"]) if "cpu_affinity" in timing else []
+        if len(settings):
+            settings = settings.assign(
+                cpus=settings.cpu_affinity.apply(lambda cpus: len(parse_cpus(cpus))),
+                threads=settings.threads.apply(
+                    lambda threads: json.loads(threads).get("OMP_NUM_THREADS", "default")
+                ),
+            )
+            print("Secs per 1k tokens (median) by number of CPUs and threads", file=outfile)
+            print(
+                settings.pivot_table(
+                    index=["annotation", "system"],
+                    columns=["cpus", "threads"],
+                    values="secs_per_1ktoken",
+                    aggfunc="median",
+                ).to_latex(float_format="%.3f"),
+                file=outfile,
+            )
+
         # 3. accuracy per morph feature (TODO)
         # + wenn POS correct und sonst
         morphcols = ["case", "degree", "gender", "mood", "number", "person", "tense"]
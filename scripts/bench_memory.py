@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+"""
+Compare the memory footprint of the token classes in `common`
+by loading the same CoNLL files with each of them.
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from pathlib import Path
+
+from common import Token, CompactToken, Document
+
+
+def measure(files, token_cls, copies):
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    docs = [
+        Document(f, token_cls=token_cls) for _ in range(copies) for f in files
+    ]
+    elapsed = time.time() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    num_tokens = sum(len(doc) for doc in docs)
+    del docs
+    return num_tokens, current, peak, elapsed
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "indir",
+        nargs="?",
+        default="../data/gold/balanced/annotations-upos",
+        type=Path,
+    )
+    argparser.add_argument(
+        "-n", "--copies", default=10, type=int, help="load every file n times"
+    )
+    args = argparser.parse_args()
+
+    files = sorted(args.indir.glob("*.conll"))
+    print("class", "tokens", "MB", "bytes/token", "peak_MB", "secs", sep="\t")
+    for token_cls in [Token, CompactToken]:
+        num_tokens, current, peak, elapsed = measure(files, token_cls, args.copies)
+        print(
+            token_cls.__name__,
+            num_tokens,
+            "%.1f" % (current / 2 ** 20),
+            "%.0f" % (current / num_tokens),
+            "%.1f" % (peak / 2 ** 20),
+            "%.2f" % elapsed,
+            sep="\t",
+        )
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+"""
+Corpus-size scaling benchmark.
+
+Builds inputs of 1k to 1M tokens by repeating the sentences of the
+balanced gold data (raw text for tokenizers, tokenized text for
+taggers, CoNLL annotations for lemmatizers and parsers) and runs every
+registered system on them, loading each model only once. Throughput
+(tokens/s) and peak memory (of the Python process plus that of child
+processes such as TreeTagger or the CoreNLP server) are written to
+`../eval/scaling.csv` and plotted against input size; the fitted
+log-log slope of run time over size is ~1 for linear and ~2 for quadratic systems.
+"""
+
+import argparse
+import importlib
+import multiprocessing
+import tempfile
+from itertools import cycle
+from pathlib import Path
+
+from common import run_instance
+
+GOLD = Path("../data/gold/balanced")
+
+# input directory and format of each annotation level
+TASKS = {
+    "tokens": "txt",
+    "pos": "tokens",
+    "lemmas": "annotations",
+    "depparse": "annotations",
+}
+
+COLUMNS = [
+    "task",
+    "system",
+    "num_tokens",
+    "run_time",
+    "process_time",
+    "postprocess_time",
+    "run_peak_rss",
+    "run_children_peak_rss",
+    "tokens_per_sec",
+]
+
+
+def raw_sentences(txtfile, tokfile):
+    """Cut the raw text of `txtfile` into (text, num_tokens) units at the
+    sentence boundaries of its tokenized version. Whatever cannot be
+    aligned (normalized characters) becomes one last unit."""
+    text = txtfile.read_text(encoding="utf-8")
+    units = list()
+    start = pos = 0
+    lines = tokfile.read_text(encoding="utf-8").splitlines()
+    for i, line in enumerate(lines):
+        tokens = line.split()
+        for tok in tokens:
+            found = text.find(tok, pos)
+            if found < 0:
+                rest = sum(len(l.split()) for l in lines[i:])
+                units.append((text[start:].strip(), rest))
+                return units
+            pos = found + len(tok)
+        units.append((text[start:pos].strip(), len(tokens)))
+        start = pos
+    if text[start:].strip():
+        units.append((text[start:].strip(), 0))
+    return units
+
+
+def sentence_units(fmt):
+    """(text, num_tokens) sentences of each gold file, in `fmt`."""
+    files = list()
+    if fmt == "txt":
+        for txtfile in sorted((GOLD / "txt").iterdir()):
+            domain, *_ = txtfile.stem.split("_")
+            files.append(raw_sentences(txtfile, GOLD / "tokens" / f"{domain}.txt"))
+    elif fmt == "tokens":
+        for tokfile in sorted((GOLD / "tokens").iterdir()):
+            lines = tokfile.read_text(encoding="utf-8").splitlines()
+            files.append([(line + "\n", len(line.split())) for line in lines if line])
+    else:
+        for conllfile in sorted((GOLD / fmt).iterdir()):
+            blocks = conllfile.read_text(encoding="utf-8").strip().split("\n\n")
+            files.append([(block + "\n\n", block.count("\n") + 1) for block in blocks])
+    return files
+
+
+def build_input(fmt, size):
+    """Repeat the gold files until the input has at least `size` tokens.
+    Returns the input text and its actual number of tokens."""
+    parts = list()
+    num_tokens = 0
+    for units in cycle(sentence_units(fmt)):
+        for text, length in units:
+            parts.append(text)
+            num_tokens += length
+            if num_tokens >= size:
+                break
+        if fmt == "txt":
+            # every gold file is one paragraph
+            parts[-1] += "\n"
+        if num_tokens >= size:
+            break
+    sep = " " if fmt == "txt" else ""
+    return sep.join(parts).replace("\n ", "\n"), num_tokens
+
+
+def make_inputs(task, sizes, indir):
+    """Write one input file per size, named so that `run_instance`
+    uses the size as the domain."""
+    taskdir = indir / task
+    taskdir.mkdir(parents=True, exist_ok=True)
+    inputs = list()
+    for size in sizes:
+        text, num_tokens = build_input(TASKS[task], size)
+        path = taskdir / f"{size}_{task}.txt"
+        path.write_text(text, encoding="utf-8")
+        inputs.append((path, num_tokens))
+    return inputs
+
+
+def scale_system(module_name, sys_name, task, inputs, outdir, max_time):
+    """Load one system and run it on increasingly large inputs. Larger
+    inputs are skipped once a run took longer than `max_time` seconds."""
+    module = importlib.import_module(module_name)
+    System = next(S for S in module.SYSTEMS if S.__name__ == sys_name)
+    rows = list()
+    with System() as s:
+        for path, num_tokens in inputs:
+            (row,) = run_instance(s, sys_name.lower(), task, [path], outdir)
+            row.update(
+                task=task,
+                num_tokens=num_tokens,
+                tokens_per_sec=(
+                    num_tokens / row["run_time"] if row["run_time"] else None
+                ),
+            )
+            rows.append(row)
+            if max_time and row["run_time"] > max_time:
+                break
+    return rows
+
+
+def scaling_slope(rows):
+    """Slope of log(run time) over log(size)."""
+    import numpy as np
+
+    rows = [row for row in rows if row["run_time"] > 0]
+    if len(rows) < 2:
+        return float("nan")
+    sizes = np.log([row["num_tokens"] for row in rows])
+    times = np.log([row["run_time"] for row in rows])
+    return np.polyfit(sizes, times, 1)[0]
+
+
+def total_peak_rss(row):
+    """Peak RSS of the Python process and its child processes."""
+    return row["run_peak_rss"] + (row.get("run_children_peak_rss") or 0)
+
+
+def plot(results, outpath):
+    import matplotlib.pyplot as plt
+
+    tasks = sorted({row["task"] for row in results}, key=list(TASKS).index)
+    fig, axes = plt.subplots(
+        2, len(tasks), figsize=(4 * len(tasks), 7), squeeze=False, sharex=True
+    )
+    for col, task in enumerate(tasks):
+        systems = sorted({row["system"] for row in results if row["task"] == task})
+        for system in systems:
+            rows = [r for r in results if r["task"] == task and r["system"] == system]
+            sizes = [row["num_tokens"] for row in rows]
+            axes[0][col].plot(
+                sizes, [row["tokens_per_sec"] for row in rows], marker="o", label=system
+            )
+            axes[1][col].plot(
+                sizes, [total_peak_rss(row) / 2 ** 20 for row in rows], marker="o"
+            )
+        axes[0][col].set_title(task)
+        axes[0][col].legend(fontsize=6)
+        axes[1][col].set_xlabel("tokens")
+        for ax in (axes[0][col], axes[1][col]):
+            ax.set_xscale("log")
+            ax.set_yscale("log")
+    axes[0][0].set_ylabel("tokens/s")
+    axes[1][0].set_ylabel("peak RSS incl. children (MiB)")
+    fig.set_tight_layout(True)
+    fig.savefig(outpath, dpi=400)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "--sizes",
+        nargs="+",
+        default=[1000, 10000, 100000, 1000000],
+        type=int,
+        help="input sizes in tokens",
+    )
+    argparser.add_argument("--tasks", nargs="+", default=list(TASKS), choices=TASKS)
+    argparser.add_argument(
+        "-s", "--systems", nargs="+", help="names of systems to run (lowercase)"
+    )
+    argparser.add_argument(
+        "--max-time",
+        default=600,
+        type=float,
+        help="don't try larger inputs after a run took longer (secs)",
+    )
+    argparser.add_argument("--outfile", default="../eval/scaling.csv", type=Path)
+    argparser.add_argument("--plot", default="../eval/scalingplot.png", type=Path)
+    args = argparser.parse_args()
+
+    results = list()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        for task in args.tasks:
+            inputs = make_inputs(task, sorted(args.sizes), tmpdir / "input")
+            try:
+                module = importlib.import_module(task)
+            except ImportError as exc:
+                print(f"Skipping {task}: {exc}")
+                continue
+            for System in module.SYSTEMS:
+                sys_name = System.__name__
+                if args.systems and sys_name.lower() not in args.systems:
+                    continue
+                # a fresh process per system, so that memory is not
+                # shared with previously loaded models
+                with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+                    try:
+                        rows = pool.apply(
+                            scale_system,
+                            (task, sys_name, task, inputs, tmpdir / "output", args.max_time),
+                        )
+                    except Exception as exc:
+                        print(f"{sys_name} failed: {exc!r}")
+                        continue
+                print(f"{task} {sys_name}: slope {scaling_slope(rows):.2f}")
+                results.extend(rows)
+
+    with args.outfile.open("w", encoding="utf-8") as outfile:
+        print(*COLUMNS, sep="\t", file=outfile)
+        for row in results:
+            print(*("" if row.get(col) is None else row[col] for col in COLUMNS),
+                  sep="\t", file=outfile)
+
+    if results:
+        plot(results, args.plot)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+"""
+Measure CoNLL output throughput (MB/s) of `write_conll` against the
+old one-`print`-per-sentence path of `TestSystem.write_exp_results`.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from common import Token, CompactToken, Document, open_output, write_conll
+
+
+def write_print(sentences, path):
+    with path.open("w", encoding="utf-8") as outfile:
+        for sent in sentences:
+            print(sent, end="", file=outfile)
+
+
+def write_buffered(sentences, path):
+    with open_output(path) as outfile:
+        write_conll(sentences, outfile)
+
+
+def throughput(writer, sentences, path, size, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        writer(sentences, path)
+        best = min(best, time.perf_counter() - start)
+    return size / best / 2 ** 20, path.stat().st_size
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "indir",
+        nargs="?",
+        default="../data/gold/balanced/annotations-upos",
+        type=Path,
+    )
+    argparser.add_argument(
+        "-n", "--copies", default=20, type=int, help="write every file n times"
+    )
+    argparser.add_argument("-r", "--repeat", default=3, type=int)
+    args = argparser.parse_args()
+
+    files = sorted(args.indir.glob("*.conll"))
+    print("token_cls", "writer", "MB/s", "file_MB", sep="\t")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        for token_cls in [Token, CompactToken]:
+            sentences = [
+                sent
+                for _ in range(args.copies)
+                for f in files
+                for sent in Document(f, token_cls=token_cls)
+            ]
+            size = sum(len(str(sent).encode("utf-8")) for sent in sentences)
+            for name, writer, suffix in [
+                ("print", write_print, ".conll"),
+                ("write_conll", write_buffered, ".conll"),
+                ("write_conll+gz", write_buffered, ".conll.gz"),
+                ("write_conll+zst", write_buffered, ".conll.zst"),
+            ]:
+                try:
+                    mbs, filesize = throughput(
+                        writer, sentences, tmpdir / ("out" + suffix), size, args.repeat
+                    )
+                except ImportError:
+                    # zstandard not installed
+                    continue
+                print(
+                    token_cls.__name__,
+                    name,
+                    "%.1f" % mbs,
+                    "%.2f" % (filesize / 2 ** 20),
+                    sep="\t",
+                )
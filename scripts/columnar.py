@@ -0,0 +1,336 @@
+"""
+Column-oriented alternative to `common.Document`.
+
+Every annotation field is stored as one NumPy array of integer ids
+into a `Vocab`, plus an array of sentence offsets. Sentences and tokens
+are only created as light read-only views over these columns, so
+whole-corpus comparisons can be done on the arrays directly.
+"""
+
+import hashlib
+import io
+import json
+import os
+import zipfile
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+from common import (
+    BaseToken,
+    file_sha1,
+    input_stem,
+    intern_str,
+    normalize_feats,
+    open_input,
+)
+
+COLUMNS = "word lemma upos xpos feats head deprel deps misc".split()
+
+
+class Vocab:
+    """Maps strings to integer ids and back. Id 0 is always `_`."""
+
+    def __init__(self):
+        self.ids = {"_": 0}
+        self.strings = ["_"]
+        # `table()`, rebuilt after strings were added
+        self._table = None
+
+    def add(self, string):
+        try:
+            return self.ids[string]
+        except KeyError:
+            self.ids[string] = len(self.strings)
+            self.strings.append(intern_str(string))
+            self._table = None
+            return self.ids[string]
+
+    def __getitem__(self, key):
+        return self.strings[key]
+
+    def __len__(self):
+        return len(self.strings)
+
+    def id_of(self, string):
+        """Id of `string`, or -1 if it has never been added."""
+        return self.ids.get(string, -1)
+
+    def table(self, func=None, dtype=object):
+        """Array with `func(s)` for every string, indexable by id."""
+        if func is None:
+            if self._table is None:
+                self._table = np.array(self.strings, dtype=object)
+            return self._table
+        return np.array([func(s) for s in self.strings], dtype=dtype)
+
+
+class ColumnToken(BaseToken):
+    __slots__ = ("doc", "i", "start")
+
+    def __init__(self, doc, i, start):
+        self.doc = doc
+        self.i = i
+        self.start = start
+
+    def __getattr__(self, name):
+        if name in COLUMNS:
+            return self.doc.vocab[self.doc.columns[name][self.i]]
+        raise AttributeError(name)
+
+    @property
+    def id(self):
+        return str(self.i - self.start + 1)
+
+    @property
+    def parent(self):
+        head = self.doc.head_offsets()[self.i]
+        if head < 0:
+            raise AttributeError("parent")
+        return ColumnToken(self.doc, head, self.start)
+
+    @property
+    def children(self):
+        doc = self.doc
+        heads = doc.head_offsets()[self.start : doc.sentence_end(self.i)]
+        return [
+            ColumnToken(doc, self.start + j, self.start)
+            for j in np.flatnonzero(heads == self.i)
+        ]
+
+
+class ColumnSentence:
+    def __init__(self, doc, start, stop):
+        self.doc = doc
+        self.start = start
+        self.stop = stop
+
+    def __getitem__(self, key):
+        return self.tokens[key]
+
+    def __iter__(self):
+        return (ColumnToken(self.doc, i, self.start) for i in range(self.start, self.stop))
+
+    def __len__(self):
+        return self.stop - self.start
+
+    @property
+    def tokens(self):
+        return list(self)
+
+    def __str__(self):
+        return "\n".join(str(entry) for entry in self) + "\n\n"
+
+
+class ColumnDocument:
+    """Read a CoNLL file (`Path`, file handle or string) into columns.
+    Ids are only comparable between documents sharing a `vocab`; by
+    default every document has its own."""
+
+    def __init__(self, inputdata, hidden_fields=None, vocab=None):
+        self.name = input_stem(inputdata) if isinstance(inputdata, Path) else ""
+        self.vocab = vocab if vocab is not None else Vocab()
+        self._head_offsets = None
+
+        if isinstance(inputdata, Path):
+            with open_input(inputdata) as infile:
+                self._read(infile, hidden_fields)
+        elif isinstance(inputdata, str):
+            self._read(io.StringIO(inputdata), hidden_fields)
+        else:
+            self._read(inputdata, hidden_fields)
+
+    @classmethod
+    def from_columns(cls, name, strings, columns, offsets, vocab=None):
+        """Document over id `columns` into the list `strings`, with the
+        ids translated to `vocab`."""
+        doc = cls.__new__(cls)
+        doc.name = name
+        doc.vocab = vocab if vocab is not None else Vocab()
+        doc._head_offsets = None
+        ids = np.array([doc.vocab.add(string) for string in strings], dtype=np.int32)
+        doc.columns = {col: ids[columns[col]] for col in COLUMNS}
+        doc.offsets = offsets
+        return doc
+
+    def _read(self, infile, hidden_fields):
+        hidden = set(hidden_fields or [])
+        add = self.vocab.add
+        cols = {name: array("l") for name in COLUMNS}
+        offsets = array("l", [0])
+        n = 0
+        sent_len = 0
+        for line in infile:
+            if not line.strip():
+                if sent_len:
+                    offsets.append(n)
+                    sent_len = 0
+                continue
+            values = line.rstrip().split("\t")[1:]
+            values += ["_"] * (len(COLUMNS) - len(values))
+            sent_len += 1
+            for name, val in zip(COLUMNS, values):
+                if name in hidden:
+                    val = str(sent_len) if name == "head" else "_"
+                elif not val:
+                    val = "_"
+                elif name == "feats":
+                    val = normalize_feats(val)
+                cols[name].append(add(val))
+            n += 1
+        if sent_len:
+            offsets.append(n)
+
+        self.columns = {name: np.array(col, dtype=np.int32) for name, col in cols.items()}
+        self.offsets = np.array(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, key):
+        return ColumnSentence(self, int(self.offsets[key]), int(self.offsets[key + 1]))
+
+    def __iter__(self):
+        return (
+            ColumnSentence(self, int(start), int(stop))
+            for start, stop in zip(self.offsets[:-1], self.offsets[1:])
+        )
+
+    @property
+    def sentences(self):
+        return list(self)
+
+    @property
+    def tokens(self):
+        return [tok for sent in self for tok in sent]
+
+    def __str__(self):
+        return "".join(str(sentence) for sentence in self)
+
+    def column(self, name):
+        """The id array of a column."""
+        return self.columns[name]
+
+    def strings(self, name):
+        """The decoded values of a column as an object array."""
+        return self.vocab.table()[self.columns[name]]
+
+    def sentence_starts(self):
+        """Offset of the first token of each token's sentence."""
+        lengths = np.diff(self.offsets)
+        return np.repeat(self.offsets[:-1], lengths)
+
+    def sentence_end(self, i):
+        return int(self.offsets[np.searchsorted(self.offsets, i, side="right")])
+
+    def head_offsets(self):
+        """Document offset of each token's head, -1 for roots and
+        tokens without (numeric) head."""
+        if self._head_offsets is None:
+            to_int = self.vocab.table(
+                lambda s: int(s) if s.isdigit() else 0, dtype=np.int64
+            )
+            heads = to_int[self.columns["head"]]
+            self._head_offsets = np.where(
+                heads > 0, self.sentence_starts() + heads - 1, -1
+            )
+        return self._head_offsets
+
+
+# parsed files are cached here by `cached_document`
+CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / ".doccache"
+CACHE_VERSION = 1
+
+
+def cached_document(path, vocab=None):
+    """`ColumnDocument(path, vocab=vocab)`, loaded from the columns
+    saved by an earlier call if the file has not changed since.
+
+    Entries are keyed by the resolved path and are valid as long as
+    size and mtime match; if only the mtime changed, the content hash
+    decides."""
+    path = path.resolve()
+    stat = path.stat()
+    cachefile = CACHE_DIR / (hashlib.sha1(str(path).encode()).hexdigest() + ".npz")
+
+    entry = read_cache_entry(cachefile)
+    if entry is not None and (
+        entry["meta"].get("version") != CACHE_VERSION
+        or entry["meta"].get("path") != str(path)
+        or entry["meta"].get("size") != stat.st_size
+    ):
+        entry = None
+    if entry is not None and entry["meta"]["mtime"] != stat.st_mtime_ns:
+        if entry["meta"]["sha1"] == file_sha1(path):
+            entry["meta"]["mtime"] = stat.st_mtime_ns
+            write_cache_entry(cachefile, entry)
+        else:
+            entry = None
+
+    if entry is None:
+        # hashed before reading: if the file changes in between, the
+        # hash no longer matches on the next call
+        meta = {
+            "version": CACHE_VERSION,
+            "path": str(path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "sha1": file_sha1(path),
+        }
+        doc = ColumnDocument(path, vocab=vocab)
+        if vocab is None:
+            strings, columns = doc.vocab.strings, doc.columns
+        else:
+            # only the strings of this document
+            used = np.unique(np.concatenate(list(doc.columns.values())))
+            strings = [vocab[i] for i in used]
+            columns = {
+                col: np.searchsorted(used, ids).astype(np.int32)
+                for col, ids in doc.columns.items()
+            }
+        write_cache_entry(
+            cachefile,
+            {"meta": meta, "strings": strings, "columns": columns, "offsets": doc.offsets},
+        )
+        return doc
+
+    return ColumnDocument.from_columns(
+        input_stem(path),
+        entry["strings"],
+        entry["columns"],
+        entry["offsets"],
+        vocab=vocab,
+    )
+
+
+def read_cache_entry(cachefile):
+    try:
+        with np.load(cachefile) as data:
+            return {
+                "meta": json.loads(str(data["meta"])),
+                # no string contains a newline, lines are split on them
+                "strings": bytes(data["strings"]).decode("utf-8").split("\n"),
+                "columns": {col: data[col] for col in COLUMNS},
+                "offsets": data["offsets"],
+            }
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        # missing or unreadable entries are simply rebuilt
+        return None
+
+
+def write_cache_entry(cachefile, entry):
+    # write to a temp file first so that concurrent readers
+    # never see a half-written entry
+    cachefile.parent.mkdir(parents=True, exist_ok=True)
+    tmpfile = cachefile.with_name(f"{cachefile.name}.{os.getpid()}.tmp")
+    strings = "\n".join(entry["strings"]).encode("utf-8")
+    with tmpfile.open("wb") as outfile:
+        np.savez(
+            outfile,
+            meta=np.array(json.dumps(entry["meta"])),
+            strings=np.frombuffer(strings, dtype=np.uint8),
+            offsets=entry["offsets"],
+            **entry["columns"],
+        )
+    os.replace(tmpfile, cachefile)
@@ -1,60 +1,413 @@
+import hashlib
+import io
+import os
 import time
 import re
-from functools import partial
+import sys
+from array import array
+from functools import lru_cache, partial
+from operator import attrgetter
 from pathlib import Path
 
 from rft2stts import rft2stts
 
 
+def reset_peak_rss(pid="self"):
+    """Reset the kernel's peak RSS counter of a process (Linux only),
+    so that `peak_rss` reports the peak of the following phase."""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def proc_peak_rss(pid="self"):
+    """VmHWM of a process in bytes, None if unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes."""
+    hwm = proc_peak_rss()
+    if hwm is not None:
+        return hwm
+    import resource
+
+    # KiB on Linux, bytes on macOS; never reset
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def live_children(pid="self"):
+    """Pids of the running child processes of `pid` and their
+    descendants (Linux only, none elsewhere)."""
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return
+    for tid in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children") as infile:
+                children = infile.read().split()
+        except OSError:
+            continue
+        for child in children:
+            yield child
+            yield from live_children(child)
+
+
+def live_children_cpu():
+    """CPU seconds used so far by the running child processes (and
+    their descendants)."""
+    total = 0.0
+    for child in live_children():
+        try:
+            with open(f"/proc/{child}/stat") as infile:
+                # the command name may contain spaces, skip past it
+                fields = infile.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # utime, stime, cutime, cstime
+        total += sum(int(val) for val in fields[11:15]) / CLOCK_TICKS
+    return total
+
+
+def reaped_children_peak_rss():
+    """Largest peak RSS of any finished child process in bytes."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def children_cpu():
+    """CPU seconds of all child processes: those that have finished
+    (`RUSAGE_CHILDREN`) and those still running, such as the CoreNLP
+    server or the TreeTagger binary."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime + live_children_cpu()
+
+
 class Timer:
+    """Measures wall time, CPU time and peak RSS of a `with` block.
+
+    `process_elapsed` covers all threads of this process (including an
+    in-process JVM), `thread_elapsed` only the calling thread and
+    `children_elapsed` the CPU time of child processes.
+    `children_peak_rss` is the sum of the peak RSS of the running
+    child processes (e.g. a JVM server), plus that of the largest
+    child that finished during the block (the kernel only keeps the
+    maximum over all finished children)."""
+
     def __enter__(self):
+        reset_peak_rss()
+        for child in live_children():
+            reset_peak_rss(child)
+        self.reaped_peak_start = reaped_children_peak_rss()
+        self.children_start = children_cpu()
         self.start = time.time()
         self.process_start = time.process_time()
+        self.thread_start = time.thread_time()
         return self
 
     def __exit__(self, *args):
         self.stop = time.time()
         self.process_stop = time.process_time()
+        self.thread_stop = time.thread_time()
         self.elapsed = self.stop - self.start
         self.process_elapsed = self.process_stop - self.process_start
+        self.thread_elapsed = self.thread_stop - self.thread_start
+        self.children_elapsed = children_cpu() - self.children_start
+        self.peak_rss = peak_rss()
+        reaped_peak = reaped_children_peak_rss()
+        self.children_peak_rss = sum(
+            proc_peak_rss(child) or 0 for child in live_children()
+        ) + (reaped_peak if reaped_peak > self.reaped_peak_start else 0)
+
+    @classmethod
+    def recorded(
+        cls,
+        elapsed,
+        process_elapsed=None,
+        peak_rss=None,
+        thread_elapsed=None,
+        children_elapsed=None,
+        children_peak_rss=None,
+    ):
+        """A Timer holding times measured elsewhere."""
+        timer = cls()
+        timer.elapsed = elapsed
+        timer.process_elapsed = elapsed if process_elapsed is None else process_elapsed
+        timer.peak_rss = peak_rss
+        timer.thread_elapsed = thread_elapsed
+        timer.children_elapsed = children_elapsed
+        timer.children_peak_rss = children_peak_rss
+        return timer
+
+    @classmethod
+    def total(cls, timers):
+        """A Timer holding the summed times (and the highest peak RSS)
+        of `timers`."""
+        def total(attr, func=sum):
+            values = [getattr(t, attr) for t in timers if getattr(t, attr, None) is not None]
+            return func(values) if values else None
+
+        return cls.recorded(
+            total("elapsed") or 0.0,
+            total("process_elapsed") or 0.0,
+            total("peak_rss", max),
+            total("thread_elapsed"),
+            total("children_elapsed"),
+            total("children_peak_rss", max),
+        )
+
+    @classmethod
+    def from_dict(cls, times, prefix):
+        """Inverse of `as_dict`."""
+        return cls.recorded(
+            times[f"{prefix}_time"],
+            times[f"{prefix}_process_time"],
+            times.get(f"{prefix}_peak_rss"),
+            times.get(f"{prefix}_thread_process_time"),
+            times.get(f"{prefix}_children_process_time"),
+            times.get(f"{prefix}_children_peak_rss"),
+        )
+
+    def as_dict(self, prefix):
+        return {
+            f"{prefix}_time": self.elapsed,
+            f"{prefix}_process_time": self.process_elapsed,
+            f"{prefix}_peak_rss": getattr(self, "peak_rss", None),
+            f"{prefix}_thread_process_time": getattr(self, "thread_elapsed", None),
+            f"{prefix}_children_process_time": getattr(self, "children_elapsed", None),
+            f"{prefix}_children_peak_rss": getattr(self, "children_peak_rss", None),
+        }
 
 
 class TestSystem:
+    # systems that load large models (JVM, neural nets, big lexica);
+    # see `main --max-heavy`
+    memory_heavy = False
+    # model version or anything else that changes the output without a
+    # change to the class source; see manifest.py
+    version = None
+    # worker processes of the system, if any (see tokens.parallel_processor)
+    pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Shut down the worker processes of the system."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
     def process(self, input_data):
         with Timer() as self.run_time:
             self.output_data = self.processor(input_data)
         return self
 
+    def annotate(self, input_data):
+        """`process` and `postprocess`, timing both phases."""
+        self.process(input_data)
+        with Timer() as self.postprocess_time:
+            self.postprocess()
+        return self
+
+    def annotate_stream(self, inputfile, output_path, chunk_size):
+        """Tokenize `inputfile` in paragraph-aligned chunks of about
+        `chunk_size` characters and write the sentences as they come, so
+        that memory use does not grow with the input. For tokenizers,
+        whose `postprocess` puts one sentence per line in `self.data`.
+        Phase times are summed over the chunks."""
+        timers = {"run_time": [], "postprocess_time": [], "write_time": []}
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open_input(inputfile) as infile, open_output(output_path) as outfile:
+            carry = ""
+            for chunk, paragraph_end in read_chunks(infile, chunk_size):
+                text = carry + chunk
+                carry = ""
+                if not text.strip():
+                    continue
+                self.annotate(text)
+                sentences = [line for line in self.data.split("\n") if line.strip()]
+                if not paragraph_end:
+                    # the last sentence may go on in the next chunk, and
+                    # the boundary before it may depend on what follows:
+                    # tokenize the last sentences again from there
+                    if len(sentences) <= CARRY_SENTENCES:
+                        carry = text
+                        sentences = []
+                    else:
+                        # fewer sentences if a token of the first ones
+                        # was normalized and can't be found in the text
+                        for num in range(CARRY_SENTENCES, 0, -1):
+                            start = sentence_start(text, sentences[-num:])
+                            if start is not None:
+                                del sentences[-num:]
+                                carry = text[start:]
+                                break
+                        else:
+                            print(
+                                f"{inputfile}: can't find the last sentence of a "
+                                "chunk in the text, it may be split at the chunk "
+                                "boundary",
+                                file=sys.stderr,
+                            )
+                with Timer() as self.write_time:
+                    outfile.writelines(sent + "\n" for sent in sentences)
+                for attr, attr_timers in timers.items():
+                    attr_timers.append(getattr(self, attr))
+        for attr, attr_timers in timers.items():
+            setattr(self, attr, Timer.total(attr_timers))
+        return self
+
     def write_exp_results(self, output_path):
         output_path.parent.mkdir(parents=True, exist_ok=True)
 
-        with output_path.open("w", encoding="utf-8") as outfile:
-            for sent in self.data:
-                print(sent, end="", file=outfile)
+        with Timer() as self.write_time:
+            with open_output(output_path) as outfile:
+                if isinstance(self.data, str):
+                    outfile.write(self.data)
+                else:
+                    write_conll(self.data, outfile)
+
+    def phase_times(self):
+        """All phase timings of the last run, named as in TIMING_COLUMNS."""
+        times = dict()
+        for prefix, attr in [
+            ("model_load", "model_load_time"),
+            ("run", "run_time"),
+            ("postprocess", "postprocess_time"),
+            ("write", "write_time"),
+        ]:
+            if hasattr(self, attr):
+                times.update(getattr(self, attr).as_dict(prefix))
+        return times
+
+
+# sentences at the end of a chunk that are tokenized again with the next
+CARRY_SENTENCES = 3
+
+
+def read_chunks(infile, chunk_size):
+    """Yield `(text, paragraph_end)` chunks of about `chunk_size`
+    characters from `infile`, cut after the last blank line if there is
+    one (`paragraph_end`), else after the last whitespace."""
+    buffer = ""
+    for data in iter(lambda: infile.read(chunk_size), ""):
+        buffer += data
+        cut = buffer.rfind("\n\n") + 2
+        paragraph_end = cut > 1
+        if not paragraph_end:
+            cut = max(buffer.rfind(char) for char in " \t\n") + 1
+            if not cut:
+                # no whitespace yet
+                continue
+        yield buffer[:cut], paragraph_end
+        buffer = buffer[cut:]
+    # also when empty, to flush what the caller carried over
+    yield buffer, True
+
+
+def sentence_start(text, sentences):
+    """Offset of the tokenized `sentences` at the end of `text`, found by
+    searching their tokens backwards; None if a token was normalized by
+    the tokenizer and can't be found."""
+    pos = len(text)
+    for tok in reversed(" ".join(sentences).split()):
+        pos = text.rfind(tok, 0, pos)
+        if pos < 0:
+            return None
+    return pos
+
+
+def spacy_pipe(nlp, texts, batch_size, n_process):
+    """`nlp.pipe` over `texts`; `n_process` needs spaCy >= 2.2.2."""
+    kwargs = {"n_process": n_process} if n_process > 1 else {}
+    return list(nlp.pipe(texts, batch_size=batch_size, **kwargs))
+
+
+def spacy_array(docs, attrs):
+    """`Doc.to_array(attrs)` of all `docs`, one row per token."""
+    import numpy as np
+
+    if not docs:
+        return np.zeros((0, len(attrs)), dtype="uint64")
+    return np.concatenate([doc.to_array(attrs) for doc in docs])
+
+
+def spacy_strings(ids, strings):
+    """Decode a column of `spacy_array` with the string store `strings`,
+    looking up each distinct id only once."""
+    import numpy as np
+
+    unique, inverse = np.unique(ids, return_inverse=True)
+    table = np.array([strings[int(i)] for i in unique], dtype=object)
+    return table[inverse].tolist()
+
+
+def spacy_lemmas(docs, ids):
+    """Decode the LEMMA column of `spacy_array(docs, ...)`. spaCy 2
+    leaves LEMMA at 0 for tokens whose lemma it only looks up when
+    `Token.lemma_` is read (e.g. tags missing from the tag map); those
+    are read from the token."""
+    import numpy as np
+
+    lemmas = spacy_strings(ids, docs[0].vocab.strings) if docs else []
+    missing = np.flatnonzero(ids == 0)
+    if missing.size:
+        starts = np.cumsum([0] + [len(doc) for doc in docs])
+        for i in missing.tolist():
+            d = int(np.searchsorted(starts, i, side="right")) - 1
+            lemmas[i] = docs[d][i - int(starts[d])].lemma_
+    return lemmas
+
+
+# Strings read by any of the readers are interned, so equal words,
+# lemmas, tags etc. from different files share one object. Unlike a
+# module-level pool, the interpreter drops interned strings again once
+# no document uses them.
+intern_str = sys.intern
 
 
 # standard Doc is a list of lists of these
 # each sublist = sentence
-class Token:
-    fields = "id word lemma upos xpos feats head deprel deps misc".split()
+class BaseToken:
+    """Methods shared by `Token` and `CompactToken`."""
 
-    def __init__(self, **kwargs):
-        for key in Token.fields:
-            # covers unspecified fields
-            val = kwargs.get(key, "_")
-            # covers fields specified as None
-            self.__dict__[key] = val if val else "_"
-        # i'll just leave this here
-        self.children = list()
-        # make sure morph transformations are applied
-        self.feats = str(Morph(from_string=self.feats))
+    __slots__ = ()
+    fields = "id word lemma upos xpos feats head deprel deps misc".split()
 
     def __str__(self):
-        return "\t".join(self.__dict__.get(key, "_") for key in Token.fields)
+        return "\t".join(getattr(self, key, "_") for key in BaseToken.fields)
 
     @classmethod
     def from_str(cls, instring):
-        return cls(**dict(zip(Token.fields, instring.rstrip().split("\t"))))
+        values = map(intern_str, instring.rstrip().split("\t"))
+        return cls(**dict(zip(BaseToken.fields, values)))
 
     def hide_fields(self, fields_to_hide):
         for field in fields_to_hide:
@@ -63,6 +416,65 @@ class Token:
             else:
                 setattr(self, field, "_")
 
+    # dependency links are looked up in the sentence's index,
+    # which is only built when one of these is first used
+
+    @property
+    def parent(self):
+        try:
+            sentence = self.sentence
+        except AttributeError:
+            raise AttributeError("parent") from None
+        return sentence.parent_of(self)
+
+    @property
+    def children(self):
+        try:
+            sentence = self.sentence
+        except AttributeError:
+            return ()
+        return sentence.children_of(self)
+
+
+class Token(BaseToken):
+    def __init__(self, **kwargs):
+        for key in Token.fields:
+            # covers unspecified fields
+            val = kwargs.get(key, "_")
+            # covers fields specified as None
+            self.__dict__[key] = val if val else "_"
+        # make sure morph transformations are applied
+        self.feats = normalize_feats(self.feats)
+
+
+class CompactToken(BaseToken):
+    """Drop-in replacement for `Token` without a per-instance `__dict__`.
+    `feats` is normalized lazily, the first time it is read."""
+
+    __slots__ = [f for f in BaseToken.fields if f != "feats"] + [
+        "_feats",
+        "_feats_raw",
+        "sentence",
+    ]
+
+    def __init__(self, **kwargs):
+        for key in CompactToken.fields:
+            val = kwargs.get(key, "_")
+            setattr(self, key, val if val else "_")
+        self._feats_raw = self._feats
+
+    @property
+    def feats(self):
+        if self._feats_raw is not None:
+            self._feats = normalize_feats(self._feats_raw)
+            self._feats_raw = None
+        return self._feats
+
+    @feats.setter
+    def feats(self, value):
+        self._feats = value
+        self._feats_raw = None
+
 
 class Sentence:
     """Use this class instead of plain lists to make sure
@@ -72,25 +484,77 @@ class Sentence:
         self.tokens = list()
         for i, tok in enumerate(tokens, start=1):
             tok.id = str(i)
+            tok.sentence = self
             self.tokens.append(tok)
-
-        # Establish dependency links
-        for tok in self.tokens:
-            try:
-                if tok.head == "_":
-                    # establish no links
-                    pass
-                    # maybe set head to something int-like
-                    # tok.head = tok.id
-                    # tok.deprel = "null"
-                else:
-                    tok_head = int(tok.head) - 1
-                    if tok_head >= 0:
-                        tok.parent = self.tokens[tok_head]
-                        self.tokens[tok_head].children.append(tok)
-            except ValueError:
-                print("WARNING: weird value in 'head' field")
-                print(tok)
+        self._heads = None
+
+    def dependency_index(self):
+        """Build the dependency index on first use: `heads[i]` is the
+        position of token i's head (-1 for none), and the children of
+        token i are `children[child_starts[i]:child_starts[i + 1]]`.
+        Tokens with unusable heads are collected in `bad_heads`."""
+        if self._heads is None:
+            n = len(self.tokens)
+            heads = array("i")
+            self.bad_heads = list()
+            for tok in self.tokens:
+                tok_head = -1
+                if tok.head != "_":
+                    try:
+                        tok_head = int(tok.head) - 1
+                    except ValueError:
+                        self.bad_heads.append(tok)
+                    else:
+                        if tok_head >= n:
+                            self.bad_heads.append(tok)
+                            tok_head = -1
+                heads.append(max(tok_head, -1))
+
+            # counting sort keeps children in token order
+            child_starts = array("i", bytes(4 * (n + 1)))
+            for tok_head in heads:
+                if tok_head >= 0:
+                    child_starts[tok_head + 1] += 1
+            for i in range(n):
+                child_starts[i + 1] += child_starts[i]
+            children = array("i", bytes(4 * child_starts[n]))
+            fill = child_starts[:n]
+            for i, tok_head in enumerate(heads):
+                if tok_head >= 0:
+                    children[fill[tok_head]] = i
+                    fill[tok_head] += 1
+
+            self._heads = heads
+            self._child_starts = child_starts
+            self._children = children
+        return self._heads, self._child_starts, self._children
+
+    def invalidate_dependencies(self):
+        """Call after changing heads or adding/removing tokens."""
+        self._heads = None
+
+    def position(self, tok):
+        try:
+            i = int(tok.id) - 1
+            if self.tokens[i] is tok:
+                return i
+        except (ValueError, IndexError):
+            pass
+        return self.tokens.index(tok)
+
+    def parent_of(self, tok):
+        heads, _, _ = self.dependency_index()
+        tok_head = heads[self.position(tok)]
+        if tok_head < 0:
+            raise AttributeError("parent")
+        return self.tokens[tok_head]
+
+    def children_of(self, tok):
+        _, child_starts, children = self.dependency_index()
+        i = self.position(tok)
+        return [
+            self.tokens[j] for j in children[child_starts[i] : child_starts[i + 1]]
+        ]
 
     def __getitem__(self, key):
         return self.tokens[key]
@@ -103,51 +567,170 @@ class Sentence:
 
 
 class Document:
-    def __init__(self, inputdata, hidden_fields=None):
-        self.name = str()
-        self.sentences = list()
-        if isinstance(inputdata, Path):
-            with inputdata.open(encoding="utf-8") as infile:
-                self.sentences.extend(string2doc(infile.read(), hide_fields=hidden_fields))
-            self.name = inputdata.stem
-        elif isinstance(inputdata, str):
-            self.sentences.extend(string2doc(inputdata, hide_fields=hidden_fields))
-            self.name = ""
+    """A CoNLL document read from a `Path`, a file handle or a string.
+
+    With `streaming=True` no sentences are kept in memory: iterating
+    over the document reads it sentence by sentence (a `Path` is
+    reopened for every pass, a file handle can only be read once)."""
+
+    def __init__(self, inputdata, hidden_fields=None, streaming=False, token_cls=None):
+        self.name = input_stem(inputdata) if isinstance(inputdata, Path) else ""
+        self.hidden_fields = hidden_fields
+        self.streaming = streaming
+        self.token_cls = token_cls or Token
+        if streaming:
+            self.source = inputdata
+            self.sentences = None
+            self.tokens = None
         else:
-            self.sentences.extend(string2doc(inputdata.read(), hide_fields=hidden_fields))
-            self.name = ""
-
-        self.tokens = [tok for sent in self.sentences for tok in sent]
+            self.sentences = list(
+                iter_sentences(
+                    inputdata, hide_fields=hidden_fields, token_cls=self.token_cls
+                )
+            )
+            self.tokens = [tok for sent in self.sentences for tok in sent]
 
     def __getitem__(self, key):
+        if self.streaming:
+            raise TypeError("streaming Document does not support indexing")
         return self.sentences[key]
 
     def __iter__(self):
+        if self.streaming:
+            return iter_sentences(
+                self.source, hide_fields=self.hidden_fields, token_cls=self.token_cls
+            )
         return iter(self.sentences)
 
     def __len__(self):
+        if self.streaming:
+            raise TypeError("streaming Document has no len(), use iter_tokens()")
         return len(self.tokens)
 
     def __str__(self):
-        return "".join(str(sentence) for sentence in self.sentences)
+        return "".join(str(sentence) for sentence in self)
+
+    def iter_tokens(self):
+        for sentence in self:
+            yield from sentence
+
+    def check_heads(self):
+        """Build the dependency index of every sentence and report all
+        tokens with unusable `head` values in one warning."""
+        bad_heads = list()
+        for sentence in self:
+            sentence.dependency_index()
+            bad_heads.extend(sentence.bad_heads)
+        if bad_heads:
+            print(
+                f"WARNING: {len(bad_heads)} tokens with weird value in 'head' field"
+                + (f" in {self.name}" if self.name else ""),
+                file=sys.stderr,
+            )
+            for tok in bad_heads[:10]:
+                print(tok, file=sys.stderr)
+        return bad_heads
 
 
 def doc2string(conlldoc):
-    return "".join(str(sentence) for sentence in conlldoc)
+    buffer = io.StringIO()
+    write_conll(conlldoc, buffer)
+    return buffer.getvalue()
+
+
+token_values = attrgetter(*BaseToken.fields)
+
+
+def write_conll(sentences, outfile):
+    """Write sentences in CoNLL format to an open text file, one
+    `write` per sentence and without going through `Sentence.__str__`."""
+    join = "\t".join
+    for sentence in sentences:
+        outfile.write("\n".join([join(token_values(tok)) for tok in sentence]))
+        outfile.write("\n\n")
+
+
+def open_output(path, bufsize=1 << 20):
+    """Open `path` for writing text with a large buffer. Files ending in
+    `.gz` are gzip-compressed, `.zst` needs the `zstandard` package."""
+    if path.suffix == ".gz":
+        import gzip
+
+        return gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+    elif path.suffix == ".zst":
+        import zstandard
+
+        compressor = zstandard.ZstdCompressor().stream_writer(path.open("wb"))
+        return io.TextIOWrapper(io.BufferedWriter(compressor, bufsize), encoding="utf-8")
+    else:
+        return path.open("w", encoding="utf-8", buffering=bufsize)
+
+
+COMPRESSED_SUFFIXES = {".gz", ".zst"}
+
+
+def open_input(path):
+    """Open `path` for reading text, decompressing the `.gz` and `.zst`
+    files written by `open_output`."""
+    if path.suffix == ".gz":
+        import gzip
+
+        return gzip.open(path, "rt", encoding="utf-8")
+    elif path.suffix == ".zst":
+        import zstandard
+
+        reader = zstandard.ZstdDecompressor().stream_reader(path.open("rb"))
+        return io.TextIOWrapper(io.BufferedReader(reader), encoding="utf-8")
+    else:
+        return path.open(encoding="utf-8")
+
+
+def input_stem(path):
+    """`path.stem`, ignoring a compression suffix."""
+    if path.suffix in COMPRESSED_SUFFIXES:
+        path = path.with_suffix("")
+    return path.stem
 
 
-def string2doc(conllstring, hide_fields=None):
-    sentences = list()
-    sentstrings = conllstring.rstrip().split("\n\n")
-    for sentstring in sentstrings:
-        mytokens = list()
-        for t in sentstring.split("\n"):
-            t = Token.from_str(t)
+def iter_sentences(inputdata, hide_fields=None, token_cls=None):
+    """Yield `Sentence`s one at a time from a `Path`, an open file
+    handle or a CoNLL string. Only the current sentence is held in memory.
+
+    `token_cls` selects the token type (default `Token`, or `CompactToken`)."""
+    token_cls = token_cls or Token
+    if isinstance(inputdata, Path):
+        with open_input(inputdata) as infile:
+            yield from iter_sentences(infile, hide_fields=hide_fields, token_cls=token_cls)
+        return
+    elif isinstance(inputdata, str):
+        inputdata = io.StringIO(inputdata)
+
+    mytokens = list()
+    for line in inputdata:
+        if line.strip():
+            t = token_cls.from_str(line)
             if hide_fields:
                 t.hide_fields(hide_fields)
             mytokens.append(t)
-        sentences.append(Sentence(mytokens))
-    return sentences
+        elif mytokens:
+            yield Sentence(mytokens)
+            mytokens = list()
+    if mytokens:
+        yield Sentence(mytokens)
+
+
+def string2doc(conllstring, hide_fields=None, token_cls=None):
+    return list(
+        iter_sentences(conllstring, hide_fields=hide_fields, token_cls=token_cls)
+    )
+
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with path.open("rb") as infile:
+        for block in iter(lambda: infile.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
 
 
 def feature(featname, arg):
@@ -208,137 +791,16 @@ class Morph:
 
     @classmethod
     def from_goldtag(cls, goldtag):
-        stts, *parts = goldtag.split(".")
-
-        def fields_for_tag(tag):
-            if tag.startswith("V") and tag.endswith("IMP"):
-                return [number]
-            elif tag.startswith("V") and tag.endswith("FIN"):
-                return [person, number, tense, mood]
-            elif tag == "ADJA":
-                return [degree, gender, case, number]
-            elif tag == "ADJD":
-                return [degree]
-            elif tag in {
-                "NN",
-                "NE",
-                "ART",
-                "PPOSS",
-                "PPOSAT",
-                "PDAT",
-                "PDS",
-                "PIS",
-                "PIDAT",
-                "PIAT",
-                "PRELS",
-                "PRELAT",
-                "PWS",
-                "PWAT",
-            }:
-                return [gender, case, number]
-            elif tag == "PPER":
-                return [person, number, gender, case]
-            elif tag == "PRF":
-                return [person, number, case]
-            elif tag == "APPRART":
-                return [gender, case]
-            else:
-                return []
-
-        active_fields = fields_for_tag(stts)
-        feats = dict(f(p) for f, p in zip(active_fields, parts))
-        return cls(**feats, orig_tag=goldtag)
+        return cls(**dict(tag_feats("gold", goldtag)), orig_tag=goldtag)
 
     @classmethod
     def from_tigertag(cls, tigertag):
         """Extract morphological information from a TIGER tag."""
-        stts, *parts = tigertag.split(".")
-
-        # Maps an POS tag to the list of functions we need in
-        # order to interpret the morphological information.
-        def fields_for_tag(tag):
-            if tag == "ADJA":
-                return [degree, case, number, gender]
-            elif tag == "ADJD":
-                return [degree]
-            elif tag in {"VVFIN", "VAFIN", "VMFIN"}:
-                return [person, number, tense, mood]
-            elif tag in {"VVIMP", "VAIMP"}:
-                return [person, number, mood]
-            elif tag in {
-                "APPRART",
-                "ART",
-                "NN",
-                "NE",
-                "PPOSAT",
-                "PPOSS",
-                "PDAT",
-                "PDS",
-                "PIAT",
-                "PIS",
-                "PRELS",
-                "PRELAT",
-                "PWAT",
-                "PWS",
-            }:
-                return [case, number, gender]
-            elif tag == "PPER":
-                return [person, case, number, gender]
-            elif tag == "PRF":
-                return [person, case, number]
-            else:
-                return []
-
-        active_fields = fields_for_tag(stts)
-        feats = dict(f(p) for f, p in zip(active_fields, parts))
-        return cls(**feats, orig_tag=tigertag)
+        return cls(**dict(tag_feats("tiger", tigertag)), orig_tag=tigertag)
 
     @classmethod
     def from_rftag(cls, rftag):
-        for rftag_begin, stts_tag in rft2stts:
-            tigertag, n = re.subn(f"^{rftag_begin}", stts_tag, rftag)
-            if n > 0:
-                break
-        else:
-            tigertag = rftag
-
-        stts, *parts = tigertag.split(".")
-
-        # Maps an POS tag to the list of functions we need in
-        # order to interpret the morphological information.
-        def fields_for_tag(tag):
-            if tag == "ADJA":
-                return [degree, case, number, gender]
-            elif tag == "ADJD":
-                return [degree]
-            elif tag in {"VVFIN", "VAFIN", "VMFIN"}:
-                return [person, number, tense, mood]
-            elif tag in {"VVIMP", "VAIMP"}:
-                return [person, number, mood]
-            elif tag in {"APPRART", "ART", "NN", "NE"}:
-                return [case, number, gender]
-            elif tag in {
-                "PPOSAT",
-                "PPOSS",
-                "PDAT",
-                "PDS",
-                "PIAT",
-                "PIS",
-                "PRELS",
-                "PRELAT",
-                "PWAT",
-                "PWS",
-                "PRF",
-            }:
-                return [person, case, number]
-            elif tag == "PPER":
-                return [person, case, number, gender]
-            else:
-                return []
-
-        active_fields = fields_for_tag(stts)
-        feats = dict(f(p) for f, p in zip(active_fields, parts))
-        return cls(**feats, orig_tag=rftag)
+        return cls(**dict(tag_feats("rftagger", rftag)), orig_tag=rftag)
 
     @classmethod
     def from_stanfordnlp(cls, snlp_tag):
@@ -347,111 +809,705 @@ class Morph:
 
     @classmethod
     def from_parzu(cls, parzutag):
+        return cls(**dict(tag_feats("parzu", parzutag)), orig_tag=parzutag)
+
+
+def fields_table(*rules):
+    """Build a lookup table STTS tag -> feature functions from
+    (space-separated tags, functions) pairs."""
+    table = dict()
+    for tags, fields in rules:
+        for tag in tags.split():
+            table[tag] = tuple(fields)
+    return table
+
+
+# Map a POS tag to the list of functions we need in order to
+# interpret the morphological information, per tag scheme.
+# `affixes` are checked first and match tags by (prefix, suffix).
+MORPH_SCHEMES = {
+    "gold": {
+        "affixes": [
+            (("V", "IMP"), (number,)),
+            (("V", "FIN"), (person, number, tense, mood)),
+        ],
+        "fields": fields_table(
+            ("ADJA", [degree, gender, case, number]),
+            ("ADJD", [degree]),
+            (
+                "NN NE ART PPOSS PPOSAT PDAT PDS PIS PIDAT PIAT PRELS PRELAT PWS PWAT",
+                [gender, case, number],
+            ),
+            ("PPER", [person, number, gender, case]),
+            ("PRF", [person, number, case]),
+            ("APPRART", [gender, case]),
+        ),
+    },
+    "tiger": {
+        "affixes": [],
+        "fields": fields_table(
+            ("ADJA", [degree, case, number, gender]),
+            ("ADJD", [degree]),
+            ("VVFIN VAFIN VMFIN", [person, number, tense, mood]),
+            ("VVIMP VAIMP", [person, number, mood]),
+            (
+                "APPRART ART NN NE PPOSAT PPOSS PDAT PDS PIAT PIS PRELS PRELAT PWAT PWS",
+                [case, number, gender],
+            ),
+            ("PPER", [person, case, number, gender]),
+            ("PRF", [person, case, number]),
+        ),
+    },
+    "rftagger": {
+        "affixes": [],
+        "fields": fields_table(
+            ("ADJA", [degree, case, number, gender]),
+            ("ADJD", [degree]),
+            ("VVFIN VAFIN VMFIN", [person, number, tense, mood]),
+            ("VVIMP VAIMP", [person, number, mood]),
+            ("APPRART ART NN NE", [case, number, gender]),
+            (
+                "PPOSAT PPOSS PDAT PDS PIAT PIS PRELS PRELAT PWAT PWS PRF",
+                [person, case, number],
+            ),
+            ("PPER", [person, case, number, gender]),
+        ),
+    },
+    "parzu": {
+        "affixes": [],
+        "fields": fields_table(
+            ("PPER", [person, number, gender, case]),
+            ("ADJA", [degree, gender, case, number, null, null]),
+            ("ADJD", [degree, null]),
+            ("ART", [definite, gender, case, number]),
+            ("APPRART APPR", [case]),
+            ("VVFIN VAFIN VMFIN", [person, number, tense, mood]),
+            ("VVIMP VAIMP", [number]),
+            (
+                "NN NE PIS PIAT PPOSAT PDS PWS PRELS PRELAT PDAT PWAT PPOSS",
+                [gender, case, number],
+            ),
+            ("PRF", [person, number, case]),
+        ),
+    },
+}
+
+
+def split_tag(scheme, tag):
+    if scheme == "parzu":
         # "_" -> "*" for underspecified vals
         # (remember to prepend stts tag)
-        stts, *parts = parzutag.replace("_", "*").split("|")
-
-        def fields_for_tag(tag):
-            if tag == "PPER":
-                return [person, number, gender, case]
-            elif tag == "ADJA":
-                return [degree, gender, case, number, null, null]
-            elif tag == "ADJD":
-                return [degree, null]
-            elif tag == "ART":
-                return [definite, gender, case, number]
-            elif tag in {"APPRART", "APPR"}:
-                return [case]
-            elif tag in {"VVFIN", "VAFIN", "VMFIN"}:
-                return [person, number, tense, mood]
-            elif tag in {"VVIMP", "VAIMP"}:
-                return [number]
-            elif tag in {
-                "NN",
-                "NE",
-                "PIS",
-                "PIAT",
-                "PPOSAT",
-                "PDS",
-                "PWS",
-                "PRELS",
-                "PRELAT",
-                "PDAT",
-                "PWAT",
-                "PPOSS",
-            }:
-                return [gender, case, number]
-            elif tag == "PRF":
-                return [person, number, case]
-            else:
-                return []
+        return tag.replace("_", "*").split("|")
+    elif scheme == "rftagger":
+        return rftag2tiger(tag).split(".")
+    else:
+        return tag.split(".")
+
+
+@lru_cache(maxsize=4096)
+def tag_feats(scheme, tag):
+    """The (feature, value) pairs encoded in `tag` according to one of
+    the `MORPH_SCHEMES`. Cached, since tag vocabularies are small."""
+    stts, *parts = split_tag(scheme, tag)
+    rules = MORPH_SCHEMES[scheme]
+    for (prefix, suffix), fields in rules["affixes"]:
+        if stts.startswith(prefix) and stts.endswith(suffix):
+            break
+    else:
+        fields = rules["fields"].get(stts, ())
+    return tuple(dict(f(p) for f, p in zip(fields, parts)).items())
+
+
+@lru_cache(maxsize=4096)
+def normalize_feats(feats):
+    """Normalized string form of a feats value (see `Morph`).
+    Cached, since a corpus only has a few hundred distinct feats strings."""
+    return str(Morph(from_string=feats))
+
+
+def rft_prefix_pattern(escape):
+    """One compiled alternation over all `rft2stts` prefixes.
+    Alternatives are tried in list order, i.e. longest prefix first,
+    and `match.lastindex` points back into `rft2stts`."""
+    return re.compile(
+        "^(?:"
+        + "|".join(f"({re.escape(key) if escape else key})" for key, _ in rft2stts)
+        + ")"
+    )
+
+
+# the unescaped version keeps the old `re.subn` semantics of `from_rftag`
+RFTAG_PREFIX = rft_prefix_pattern(escape=False)
+RFTAG_PREFIX_LITERAL = rft_prefix_pattern(escape=True)
 
-        active_fields = fields_for_tag(stts)
-        feats = dict(f(p) for f, p in zip(active_fields, parts))
-        return cls(**feats, orig_tag=parzutag)
+
+@lru_cache(maxsize=4096)
+def rftag2tiger(rftag):
+    """Replace the RFTagger prefix of `rftag` with the STTS tag,
+    keeping the morphological part."""
+    match = RFTAG_PREFIX.match(rftag)
+    if match:
+        return rft2stts[match.lastindex - 1][1] + rftag[match.end() :]
+    else:
+        return rftag
 
 
+@lru_cache(maxsize=4096)
 def rftag2stts(rftag):
-    for key, val in rft2stts:
-        if rftag.startswith(key):
-            return val
+    match = RFTAG_PREFIX_LITERAL.match(rftag)
+    if match:
+        return rft2stts[match.lastindex - 1][1]
     else:
         return rftag
 
 
+def run_system(
+    System,
+    task,
+    inputfiles,
+    outdir,
+    compress=None,
+    repeat=1,
+    warmup=0,
+    profile_dir=None,
+    chunk_size=None,
+    profile_mode="cprofile",
+):
+    """Load `System` once and run it on every input file.
+    Yields one timing row per file and timed repetition."""
+    with System() as s:
+        yield from run_instance(
+            s,
+            System.__name__.lower(),
+            task,
+            inputfiles,
+            outdir,
+            compress,
+            repeat=repeat,
+            warmup=warmup,
+            profile_dir=profile_dir,
+            chunk_size=chunk_size,
+            profile_mode=profile_mode,
+        )
+
+
+def output_path(outdir, sys_name, task, inputfile, compress=None):
+    domain, *_ = inputfile.stem.split("_")
+    ext = ".conll" if task != "tokens" else ".txt"
+    if compress:
+        ext += "." + compress
+    return outdir / sys_name / task / f"{domain}_{task}{ext}"
+
+
+def run_instance(
+    s,
+    sys_name,
+    task,
+    inputfiles,
+    outdir,
+    compress=None,
+    label=None,
+    repeat=1,
+    warmup=0,
+    profile_dir=None,
+    chunk_size=None,
+    profile_mode="cprofile",
+):
+    """Annotate every input file `warmup` times untimed, then `repeat`
+    times timed, with the model loaded only once. The output of the
+    last repetition is written. With `profile_dir`, the timed runs are
+    profiled in `profile_mode` (see profiling.py). With `chunk_size`, tokenizers read and
+    write their files piece by piece (`TestSystem.annotate_stream`)."""
+    from contextlib import nullcontext
+
+    for inputfile in inputfiles:
+        print(f"Running {label or s.__class__.__name__} on {str(inputfile)}...")
+
+        domain, *_ = inputfile.stem.split("_")
+
+        # gold annotations to hide from the test systems
+        # fields_to_hide = {"pos": ["lemma", "upos", "xpos", "feats", "head", "deprel", "deps"],
+        #                   "lemmas": [],
+        #                   "depparse": []}
+
+        outpath = output_path(outdir, sys_name, task, inputfile, compress)
+        if chunk_size:
+            annotate = partial(s.annotate_stream, inputfile, outpath, chunk_size)
+        else:
+            with open_input(inputfile) as input_data:
+                text = input_data.read()
+            annotate = partial(s.annotate, text)
+
+        for _ in range(warmup):
+            annotate()
+
+        if profile_dir:
+            from profiling import Profile
+
+            profile = Profile(
+                profile_dir / f"{sys_name}_{domain}_{task}", profile_mode
+            )
+        else:
+            profile = nullcontext()
+
+        for sample in range(repeat):
+            with profile:
+                annotate()
+            if sample == repeat - 1:
+                if not chunk_size:
+                    s.write_exp_results(outpath)
+                times = dict(s.phase_times(), input=inputfile, output=outpath)
+            elif chunk_size:
+                times = s.phase_times()
+            else:
+                # the output is only written once
+                times = {
+                    k: v for k, v in s.phase_times().items() if not k.startswith("write_")
+                }
+
+            row = {"system": sys_name, "domain": domain, "annotation": task}
+            row.update(times)
+            # the original column name for the CPU time of `process`
+            row["process_time"] = row.pop("run_process_time")
+            row["sample"] = sample
+            row["input_bytes"] = inputfile.stat().st_size
+            yield row
+
+        if profile_dir:
+            profile.write()
+
+
+def run_system_worker(conn, job):
+    """Send the rows of `run_system(*job)`, or its exception, to `conn`."""
+    try:
+        result = list(run_system(*job))
+    except Exception as exc:
+        result = exc
+    conn.send(result)
+    conn.close()
+
+
+def run_parallel(jobs, processes, max_heavy=None):
+    """Run `(System, *run_system args)` jobs in parallel worker processes.
+
+    Each job gets a fresh worker process which loads the model once
+    and processes all of the system's input files, so JVMs and GPU
+    memory are released after every system. At most `processes` jobs,
+    and at most `max_heavy` jobs of `memory_heavy` systems, run at the
+    same time. Yields timing rows as jobs finish; raises the job's
+    exception, or RuntimeError if a worker dies without one (e.g.
+    killed by the OOM killer)."""
+    import multiprocessing
+    from multiprocessing.connection import wait
+
+    pending = list(jobs)
+    # receiving end of the pipe -> (System, worker process)
+    running = dict()
+
+    def start(job):
+        recv_conn, send_conn = multiprocessing.Pipe(duplex=False)
+        # daemonic like pool workers, see `tokens.parallel_processor`
+        worker = multiprocessing.Process(
+            target=run_system_worker, args=(send_conn, job), daemon=True
+        )
+        worker.start()
+        # only the worker holds the sending end now, so a dead worker
+        # shows up as EOF
+        send_conn.close()
+        running[recv_conn] = (job[0], worker)
+
+    try:
+        while pending or running:
+            for job in list(pending):
+                if len(running) >= processes:
+                    break
+                num_heavy = sum(S.memory_heavy for S, _ in running.values())
+                if (
+                    job[0].memory_heavy
+                    and max_heavy is not None
+                    and running
+                    and num_heavy >= max_heavy
+                ):
+                    continue
+                pending.remove(job)
+                start(job)
+
+            for conn in wait(list(running)):
+                System, worker = running.pop(conn)
+                try:
+                    rows = conn.recv()
+                except EOFError:
+                    rows = None
+                conn.close()
+                worker.join()
+                if rows is None:
+                    raise RuntimeError(
+                        f"worker running {System.__name__} died "
+                        f"(exit code {worker.exitcode})"
+                    )
+                if isinstance(rows, Exception):
+                    raise rows
+                yield from rows
+    finally:
+        for conn, (_, worker) in running.items():
+            worker.terminate()
+            worker.join()
+            conn.close()
+
+
+# environment variables that control the number of threads of the
+# wrapped libraries (PyTorch, NumPy/BLAS for spaCy, TensorFlow)
+THREAD_VARS = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+    "TF_NUM_INTEROP_THREADS",
+]
+
+
+def parse_cpus(spec):
+    """CPU set from a list like `0-3,6`."""
+    cpus = set()
+    for part in spec.split(","):
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def format_cpus(cpus):
+    """Inverse of `parse_cpus`."""
+    ranges = list()
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def set_cpu_limits(cpus=None, threads=None):
+    """Pin this process to `cpus` and limit the thread pools of the
+    wrapped libraries to `threads`. Has to happen before the systems
+    are loaded; worker processes, JVMs and other subprocesses inherit
+    both settings."""
+    if cpus is not None:
+        if not hasattr(os, "sched_setaffinity"):
+            raise OSError("CPU affinity is not supported on this platform")
+        os.sched_setaffinity(0, cpus)
+    if threads is not None:
+        for var in THREAD_VARS:
+            os.environ[var] = str(threads)
+        # the JVM sizes its thread pools (GC, JIT, ForkJoin) by the
+        # number of CPUs it sees
+        java_opts = os.environ.get("JAVA_TOOL_OPTIONS", "")
+        java_opts = re.sub(r"\s*-XX:ActiveProcessorCount=\d+", "", java_opts)
+        os.environ["JAVA_TOOL_OPTIONS"] = (
+            f"{java_opts} -XX:ActiveProcessorCount={threads}".strip()
+        )
+        # NumPy's BLAS and torch size their pools from the variables
+        # above once, when they are first imported
+        for module in ["numpy", "torch"]:
+            if module in sys.modules:
+                print(
+                    f"WARNING: {module} was imported before the thread limit "
+                    "was set, its thread pool is not limited",
+                    file=sys.stderr,
+                )
+
+
+# timing columns, as in the legacy timing.csv (no header, new columns
+# were only ever appended); timing_store.py builds its schema from them
+TIMING_COLUMNS = [
+    "system",
+    "domain",
+    "annotation",
+    "model_load_time",
+    "run_time",
+    "process_time",
+    "exp_exec_time",
+    "model_load_process_time",
+    "model_load_peak_rss",
+    "run_peak_rss",
+    "postprocess_time",
+    "postprocess_process_time",
+    "postprocess_peak_rss",
+    "write_time",
+    "write_process_time",
+    "write_peak_rss",
+    "model_load_children_process_time",
+    "run_children_process_time",
+    "run_thread_process_time",
+    "postprocess_children_process_time",
+    "write_children_process_time",
+    "sample",
+    "model_load_children_peak_rss",
+    "run_children_peak_rss",
+    "postprocess_children_peak_rss",
+    "write_children_peak_rss",
+]
+
+
+def summarize(samples):
+    """Median, interquartile range and minimum of repeated timings."""
+    import statistics
+
+    samples = sorted(samples)
+    if len(samples) > 1:
+        q1, _, q3 = statistics.quantiles(samples, n=4)
+    else:
+        q1 = q3 = samples[0]
+    return {"median": statistics.median(samples), "iqr": q3 - q1, "min": samples[0]}
+
+
+def print_summary(rows, cols=("run_time", "postprocess_time"), file=sys.stdout):
+    """Print `summarize` of `cols` for each system and domain."""
+    samples = dict()
+    for row in rows:
+        key = (row["system"], row["domain"])
+        for col in cols:
+            if row.get(col) is not None:
+                samples.setdefault(key, dict()).setdefault(col, list()).append(row[col])
+
+    print("system", "domain", "phase", "n", "median", "iqr", "min", sep="\t", file=file)
+    for (system, domain), by_col in samples.items():
+        for col, values in by_col.items():
+            stats = summarize(values)
+            print(
+                system,
+                domain,
+                col,
+                len(values),
+                *(f"{stats[k]:.4f}" for k in ["median", "iqr", "min"]),
+                sep="\t",
+                file=file,
+            )
+
+
 def main(task, system_list):
     import argparse
     from pathlib import Path
 
     argparser = argparse.ArgumentParser()
-    argparser.add_argument("indir", type=Path)
+    argparser.add_argument("indir", nargs="?", type=Path)
     argparser.add_argument("--outdir", default="../data/system", type=Path)
     argparser.add_argument("--testing", action="store_true",
                            help="don't record timing stats")
     argparser.add_argument(
         "-s", "--systems", nargs="+", help="names of systems to run (lowercase)"
     )
+    argparser.add_argument(
+        "--compress",
+        choices=["gz", "zst"],
+        help="compress the system output files (the readers and evaluation "
+        "scripts decompress them by suffix)",
+    )
+    argparser.add_argument(
+        "-j", "--jobs", default=1, type=int,
+        help="number of systems to run in parallel worker processes "
+        "(each loads its model once and runs on all input files in turn)",
+    )
+    argparser.add_argument(
+        "--max-heavy", type=int,
+        help="max. number of memory-heavy systems running at the same time",
+    )
+    argparser.add_argument(
+        "--serve", action="store_true",
+        help="load the systems and keep them loaded as a model server",
+    )
+    argparser.add_argument(
+        "--use-server", action="store_true",
+        help="send the input files to a running model server",
+    )
+    argparser.add_argument("--socket", help="socket path of the model server")
+    argparser.add_argument(
+        "--repeat", default=1, type=int,
+        help="number of timed runs per file (the model is loaded once)",
+    )
+    argparser.add_argument(
+        "--warmup", default=0, type=int,
+        help="number of untimed runs per file before the timed ones",
+    )
+    argparser.add_argument(
+        "--profile", nargs="?", const="cprofile", choices=["cprofile", "sample"],
+        help="profile the runs with cProfile (default) or by sampling stacks; "
+        "timing is not recorded",
+    )
+    argparser.add_argument(
+        "--profile-dir", default=Path("../eval/profiles"), type=Path,
+        help="directory for the profiles (default: %(default)s)",
+    )
+    argparser.add_argument(
+        "--force", action="store_true",
+        help="also rerun systems whose outputs are up to date (for timing runs; "
+        "implied by --repeat > 1 and --profile)",
+    )
+    argparser.add_argument(
+        "--cpus", type=parse_cpus,
+        help="pin the systems to these CPUs, e.g. 0 or 0-3,6",
+    )
+    argparser.add_argument(
+        "--threads", type=int,
+        help="number of threads of the systems' backends (BLAS, PyTorch, JVM)",
+    )
+    argparser.add_argument(
+        "--batch-size", type=int,
+        help="batch size of systems with batched inference (spaCy)",
+    )
+    argparser.add_argument(
+        "--n-process", type=int,
+        help="number of processes of systems with parallel inference "
+        "(spaCy, Syntok, SoMaJo)",
+    )
+    argparser.add_argument(
+        "--chunk-size",
+        type=int,
+        help="tokenize in paragraph-aligned chunks of about this many characters, "
+        "writing the output as it goes (for large inputs; tokens only)",
+    )
     args = argparser.parse_args()
-
-    exp_exec_time = int(time.time())
-    for System in system_list:
-        sys_name = System.__name__.lower()
-
-        if args.systems and sys_name not in args.systems:
-            continue
-
-        s = System()
-        for inputfile in args.indir.iterdir():
-            print(f"Running {s.__class__.__name__} on {str(inputfile)}...")
-
-            domain, *_ = inputfile.stem.split("_")
-            ext = ".conll" if task != "tokens" else ".txt"
-
-            # gold annotations to hide from the test systems
-            # fields_to_hide = {"pos": ["lemma", "upos", "xpos", "feats", "head", "deprel", "deps"],
-            #                   "lemmas": [],
-            #                   "depparse": []}
-
-            with inputfile.open("r", encoding="utf-8") as input_data:
-                s.process(input_data.read())
-            s.postprocess()
-
-            outpath = args.outdir / sys_name / task / f"{domain}_{task}{ext}"
-            s.write_exp_results(outpath)
-
-            if not args.testing:
-                timepath = Path("../eval/timing.csv")
-                with timepath.open("a", encoding="utf-8") as outfile:
-                    print(
-                        sys_name,
-                        domain,
-                        task,
-                        s.model_load_time.elapsed,
-                        s.run_time.elapsed,
-                        s.run_time.process_elapsed,
-                        exp_exec_time,
-                        sep="\t",
-                        file=outfile,
-                    )
+    if args.repeat < 1:
+        argparser.error("--repeat must be at least 1")
+    if args.warmup < 0:
+        argparser.error("--warmup must not be negative")
+
+    set_cpu_limits(args.cpus, args.threads)
+
+    systems = [
+        System
+        for System in system_list
+        if not args.systems or System.__name__.lower() in args.systems
+    ]
+    # set before the systems are loaded, worker processes inherit them
+    for System in systems:
+        for attr in ["batch_size", "n_process"]:
+            if getattr(args, attr) is not None and hasattr(System, attr):
+                setattr(System, attr, getattr(args, attr))
+
+    if args.serve or args.use_server:
+        import model_server
+
+        socket_path = args.socket or model_server.default_socket(task)
+        if args.serve:
+            model_server.serve(systems, socket_path)
+            return
+
+    if args.indir is None:
+        argparser.error("indir is required unless --serve is given")
+    if args.profile and args.use_server:
+        argparser.error("--profile needs the systems to run in this process")
+    if args.chunk_size and (task != "tokens" or args.use_server):
+        argparser.error("--chunk-size only works for tokenizers running in this process")
+
+    import manifest
+
+    inputfiles = list(args.indir.iterdir())
+    outputs = manifest.Manifest(args.outdir)
+    if args.use_server:
+        # the code the server has loaded, which may differ from ours
+        remote = model_server.remote_systems(socket_path, args.systems)
+        identities = {s.name: s.identity for s in remote}
+    else:
+        identities = {
+            System.__name__.lower(): manifest.system_identity(
+                System, args.chunk_size
+            )
+            for System in systems
+        }
+
+    # repeated and profiled runs are for timing, skipping them would
+    # leave nothing to measure
+    force = args.force or args.repeat > 1 or args.profile
+
+    def stale_inputs(sys_name):
+        """Input files whose output by `sys_name` is not up to date."""
+        if force:
+            return inputfiles
+        stale = [
+            inputfile
+            for inputfile in inputfiles
+            if not outputs.is_current(
+                output_path(args.outdir, sys_name, task, inputfile, args.compress),
+                inputfile,
+                identities[sys_name],
+            )
+        ]
+        if not stale:
+            print(f"{sys_name} is up to date, skipping (use --force to rerun)")
+        return stale
+
+    todo = {sys_name: stale_inputs(sys_name) for sys_name in identities}
+    jobs = [
+        (
+            System,
+            task,
+            todo[System.__name__.lower()],
+            args.outdir,
+            args.compress,
+            args.repeat,
+            args.warmup,
+            args.profile_dir if args.profile else None,
+            args.chunk_size,
+            args.profile,
+        )
+        for System in systems
+        # with --use-server, `todo` only has the served systems
+        if todo.get(System.__name__.lower())
+    ]
+
+    if args.use_server:
+        rows = (
+            row
+            for s in remote
+            if todo[s.name]
+            for row in run_instance(
+                s,
+                s.name,
+                task,
+                todo[s.name],
+                args.outdir,
+                args.compress,
+                label=s.name,
+                repeat=args.repeat,
+                warmup=args.warmup,
+            )
+        )
+    elif args.jobs > 1:
+        rows = run_parallel(jobs, args.jobs, max_heavy=args.max_heavy)
+    else:
+        rows = (row for job in jobs for row in run_system(*job))
+
+    # profiler overhead would distort the timings; no runs row if
+    # everything was skipped
+    record = not args.testing and not args.profile and any(todo.values())
+    if record:
+        import timing_store
+
+        store = timing_store.connect()
+        run_id = timing_store.start_run(
+            store,
+            timing_store.run_metadata(
+                jobs=args.jobs,
+                repeat=args.repeat,
+                warmup=args.warmup,
+                batch_size=args.batch_size,
+                n_process=args.n_process,
+                chunk_size=args.chunk_size,
+            ),
+        )
+
+    recorded = list()
+    for row in rows:
+        recorded.append(row)
+        if record:
+            timing_store.add_row(store, run_id, row)
+        if "output" in row:
+            outputs.record(row["output"], row["input"], identities[row["system"]])
+            outputs.save()
+
+    if args.repeat > 1:
+        print_summary(recorded)
 
     print("done!")
@@ -5,18 +5,16 @@ from pathlib import Path
 
 import common
 from common import Timer, TestSystem, main
+from common import spacy_array, spacy_lemmas, spacy_pipe, spacy_strings
 from common import Sentence, Token, Morph, string2doc, doc2string
-from adjust_tokens import add_upos_tags
-
-from spacy.symbols import TAG
-import numpy as np
-from spacy.tokens import Doc
 
 
 HIDDEN_FIELDS = ["head", "deprel", "deps"]
 
 
 class StanfordNLP(TestSystem):
+    memory_heavy = True
+
     def __init__(self):
         self.name = "stanfordnlp"
         with Timer() as self.model_load_time:
@@ -61,6 +59,8 @@ class StanfordNLP(TestSystem):
 
 
 class CoreNLP(TestSystem):
+    memory_heavy = True
+
     def __init__(self):
         self.home = Path("/opt/stanford-corenlp-full-2018-10-05/")
         with Timer() as self.model_load_time:
@@ -114,6 +114,11 @@ class CoreNLP(TestSystem):
 
 class Spacy(TestSystem):
     # how to preserve existing pos tags? necessary?
+    memory_heavy = True
+    # see `main --batch-size/--n-process`
+    batch_size = 256
+    n_process = 1
+
     def __init__(self):
         with Timer() as self.model_load_time:
             # https://spacy.io/usage/linguistic-features#own-annotations
@@ -122,67 +127,96 @@ class Spacy(TestSystem):
             import spacy
 
             self.nlp = spacy.load("de", disable=["tagger", "ner"])
+            # the "texts" are CoNLL sentences, read into docs with our
+            # tags and sentence boundaries
+            self.nlp.tokenizer = self.read_conlldoc
 
             def myprocessor(myinput):
-                mydoc = self.read_conlldoc(myinput)
-                return self.nlp.pipeline[0][1](mydoc)
+                # one doc per sentence, parsed in batches by nlp.pipe
+                sentences = [s for s in myinput.split("\n\n") if s.strip()]
+                return spacy_pipe(self.nlp, sentences, self.batch_size, self.n_process)
 
             self.processor = myprocessor
 
     def read_conlldoc(self, inputdoc):
+        """Doc with the words, tags and sentence boundaries of a CoNLL
+        string, built in one pass without `Sentence`/`Token` objects."""
+        import numpy as np
+        from spacy.attrs import SENT_START
+        from spacy.symbols import TAG
+        from spacy.tokens import Doc
+
         words = list()
-        sentbounds = list()
-        #    pos = list()
         tags = list()
-        #    lemmas = list()
-        for sent in string2doc(inputdoc, hide_fields=HIDDEN_FIELDS):
-            for i, tok in enumerate(sent):
-                if i == 0:
-                    sentbounds.append(True)
-                else:
-                    sentbounds.append(False)
-                words.append(tok.word)
-                tags.append(self.nlp.vocab.strings.add(tok.xpos))
-                # pos.append(self.nlp.vocab.strings.add(conv_table.get(tok.xpos, "_")))
-        #            lemmas.append(self.nlp.vocab.strings.add(tok.lemma))
-        # attrs = [POS, TAG]
-        attrs = [TAG]
-        # arr = np.array(list(zip(pos, tags)), dtype="uint64")
-        arr = np.array(tags, dtype="uint64")
-        sdoc = Doc(self.nlp.vocab, words=words).from_array(attrs, arr)
-        for i, sb in enumerate(sentbounds):
-            if sb:
-                sdoc[i].is_sent_start = True
-            else:
-                # these must be set to False, since,
-                # if left as None, spaCy will add further sentbounds
-                sdoc[i].is_sent_start = False
-        #    lemma_array = np.array([[lemma] for lemma in lemmas], dtype="uint64")
-        #    sdoc.from_array([LEMMA], lemma_array)
-        if any(tags):
+        # spaCy's SENT_START: 1 starts a sentence, -1 doesn't. Tokens
+        # must not be left at 0, else spaCy adds further sentbounds
+        sent_starts = list()
+        new_sent = True
+        for line in inputdoc.split("\n"):
+            if not line.strip():
+                new_sent = True
+                continue
+            cols = line.rstrip().split("\t")
+            words.append(cols[1] if len(cols) > 1 and cols[1] else "_")
+            tags.append(cols[4] if len(cols) > 4 and cols[4] else "_")
+            sent_starts.append(1 if new_sent else -1)
+            new_sent = False
+
+        # add every distinct tag to the string store only once
+        tag_ids = {tag: self.nlp.vocab.strings.add(tag) for tag in set(tags)}
+        arr = np.empty((len(words), 2), dtype="uint64")
+        arr[:, 0] = [tag_ids[tag] for tag in tags]
+        arr[:, 1] = np.array(sent_starts, dtype=np.int64).astype("uint64")
+        sdoc = Doc(self.nlp.vocab, words=words).from_array([TAG, SENT_START], arr)
+        if tags:
             sdoc.is_tagged = True
         return sdoc
 
     def postprocess(self):
+        import numpy as np
+        from spacy.attrs import DEP, HEAD, LEMMA, ORTH
+
+        docs = self.output_data
+        arr = spacy_array(docs, [ORTH, LEMMA, HEAD, DEP])
+        strings = self.nlp.vocab.strings
+        words = spacy_strings(arr[:, 0], strings)
+        lemmas = spacy_lemmas(docs, arr[:, 1])
+        deprels = spacy_strings(arr[:, 3], strings)
+
+        # sentence boundaries as token offsets over all docs
+        bounds = list()
+        offset = 0
+        for doc in docs:
+            bounds.extend(offset + sent.start for sent in doc.sents)
+            offset += len(doc)
+        bounds.append(offset)
+
+        # HEAD is the offset of the head from the token, we want its
+        # position in the sentence (counting from 1); roots point to
+        # themselves
+        sent_starts = np.repeat(bounds[:-1], np.diff(bounds))
+        heads = np.arange(offset) + arr[:, 2].astype(np.int64) - sent_starts + 1
+        heads = heads.astype(str).tolist()
+
         self.data = list()
-        for sent in self.output_data.sents:
+        for start, end in zip(bounds[:-1], bounds[1:]):
             self.data.append(
                 Sentence(
                     Token(
-                        word=tok.text,
-                        lemma=tok.lemma_,
-                        # upos=tok.pos_,
-                        #   xpos=tok.tag_,
-                        head=str(tok.head.i - sent[0].i + 1),
-                        deprel=tok.dep_,
+                        word=words[i],
+                        lemma=lemmas[i],
+                        head=heads[i],
+                        deprel=deprels[i],
                     )
-                    for tok in sent
+                    for i in range(start, end)
                 )
             )
 
 
 class ParZu(TestSystem):
     # has option for tagged input text, inputformat = tagged
+    memory_heavy = True
+
     def __init__(self):
         with Timer() as self.model_load_time:
             sys.path.insert(0, "/opt/ParZu")
@@ -245,5 +279,8 @@ class UDPipe(TestSystem):
     pass
 
 
+SYSTEMS = [CoreNLP, ParZu, Spacy, StanfordNLP]
+
+
 if __name__ == "__main__":
-    main("depparse", [CoreNLP, ParZu, Spacy, StanfordNLP])
+    main("depparse", SYSTEMS)
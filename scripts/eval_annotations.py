@@ -9,7 +9,8 @@ from pathlib import Path
 import pandas as pd
 import numpy as np
 
-from common import Token, Document, Morph
+from common import Token, CompactToken, Document, Morph
+from columnar import Vocab, cached_document
 
 logging.basicConfig(filename="rule-application.log", filemode="w", level=logging.DEBUG)
 
@@ -418,9 +419,54 @@ def compare_pos(g, a):
         return 0
 
 
+def compare_pos_columns(g, a):
+    """Column version of `compare_pos` for two `ColumnDocument`s
+    sharing a vocab. Returns an array of 1/0 per token."""
+    vocab = g.vocab
+    gx = g.column("xpos")
+    ax = a.column("xpos")
+
+    def tag(t):
+        return vocab.id_of(t)
+
+    correct = (
+        (gx == ax)
+        | ((gx == tag("PAV")) & (ax == tag("PROAV")))
+        | ((gx == tag("PAV")) & (ax == tag("PROP")))
+        | ((gx == tag("$(")) & (ax == tag("$[")))
+    )
+    if sys_name == "stanfordnlp":
+        is_apprart = vocab.table(lambda s: s.lower() in APPRARTMAP, dtype=bool)
+        correct |= (
+            (gx == tag("APPRART"))
+            & np.isin(ax, [tag("APPR"), tag("ART")])
+            & is_apprart[g.column("word")]
+        )
+    return correct.astype(int)
+
+
+def pos_rows(g, a, genre):
+    """Result rows for the POS level, computed on whole columns."""
+    gold_xpos = g.strings("xpos")
+    rows = zip(gold_xpos, g.strings("word"), a.strings("xpos"), compare_pos_columns(g, a))
+    return [
+        {
+            "pos": gxpos,
+            "token": word,
+            "annotation": "pos",
+            "genre": genre,
+            "system": sys_name,
+            "gold_val": gxpos,
+            "sys_val": axpos,
+            "correct": int(correct),
+        }
+        for gxpos, word, axpos, correct in rows
+    ]
+
+
 if __name__ == "__main__":
 
-    all_systems = [p.name for p in SYSTEMS_DIR.iterdir()]
+    all_systems = [p.name for p in SYSTEMS_DIR.iterdir() if p.is_dir()]
 
     all_data_rows = list()
     for sys_name in all_systems:
@@ -446,10 +492,27 @@ if __name__ == "__main__":
 
             assert len(gold_files) == len(anno_files)
             for goldfile, sysfile in zip(gold_files, anno_files):
-                gold_doc = Document(goldfile)
-                sys_doc = Document(sysfile)
+                if anno_level in {"depparse", "depparseud"}:
+                    # the rules need each token's head and children
+                    gold_doc = Document(goldfile, token_cls=CompactToken)
+                    sys_doc = Document(sysfile, token_cls=CompactToken)
+                else:
+                    # a vocab per file pair: ids of both documents are
+                    # comparable, and tables stay as small as the files.
+                    # Files are only parsed again after they changed
+                    vocab = Vocab()
+                    gold_doc = cached_document(goldfile, vocab=vocab)
+                    sys_doc = cached_document(sysfile, vocab=vocab)
+                if anno_level == "pos":
+                    assert len(gold_doc) == len(sys_doc)
+                    logging.debug(f"# file = {goldfile.name}, system = {sys_name}")
+                    all_data_rows.extend(pos_rows(gold_doc, sys_doc, goldfile.stem))
+                    continue
 
                 assert len(gold_doc) == len(sys_doc)
+                if anno_level in {"depparse", "depparseud"}:
+                    gold_doc.check_heads()
+                    sys_doc.check_heads()
                 logging.debug(f"# file = {goldfile.name}, system = {sys_name}")
                 for gtok, atok in zip(gold_doc.tokens, sys_doc.tokens):
                     new_row = {
@@ -459,12 +522,7 @@ if __name__ == "__main__":
                         "genre": goldfile.stem,
                         "system": sys_name,
                     }
-                    if anno_level == "pos":
-                        new_row["gold_val"] = gtok.xpos
-                        new_row["sys_val"] = atok.xpos
-                        new_row["correct"] = compare_pos(gtok, atok)
-
-                    elif anno_level == "morph":
+                    if anno_level == "morph":
                         new_row["gold_val"] = gtok.feats
                         new_row["sys_val"] = atok.feats
                         new_row["correct"], featcols = compare_morph(gtok, atok)
@@ -5,6 +5,8 @@ from pathlib import Path
 
 import pandas as pd
 
+from common import open_input
+
 # Paths that shouldn't change
 SYSTEMS_DIR = Path("../data/system")
 GOLD_DIR = Path("../data/gold/balanced")
@@ -13,7 +15,7 @@ RESULTS_DIR = Path("../eval")
 
 def sentbounds_preprocess(tokenized_file):
     sentences = []
-    with tokenized_file.open("r", encoding="utf-8") as infile:
+    with open_input(tokenized_file) as infile:
         for line in infile:
             if not line.strip():
                 continue
@@ -26,7 +28,7 @@ def sentbounds_preprocess(tokenized_file):
 
 def tokenbounds_preprocess(tokenized_file):
     tokens = []
-    with tokenized_file.open("r", encoding="utf-8") as infile:
+    with open_input(tokenized_file) as infile:
         for line in infile:
             if not line.strip():
                 continue
@@ -98,7 +100,7 @@ def compare_bounds(gold, annotation):
 
 if __name__ == "__main__":
 
-    all_systems = [p.name for p in SYSTEMS_DIR.iterdir()]
+    all_systems = [p.name for p in SYSTEMS_DIR.iterdir() if p.is_dir()]
 
     all_data_rows = list()
 
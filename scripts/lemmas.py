@@ -16,6 +16,8 @@ HIDDEN_FIELDS = ["upos", "xpos", "feats", "head", "deprel", "deps"]
 
 
 class GermaLemma(TestSystem):
+    memory_heavy = True
+
     def __init__(self):
         with Timer() as self.model_load_time:
             import germalemma
@@ -69,6 +71,8 @@ class CustomLemmatizer(TestSystem):
 
 
 class IWNLP(TestSystem):
+    memory_heavy = True
+
     def __init__(self):
         with Timer() as self.model_load_time:
             from iwnlp.iwnlp_wrapper import IWNLPWrapper
@@ -102,5 +106,8 @@ class IWNLP(TestSystem):
         self.data = doc2string(self.output_data)
 
 
+SYSTEMS = [GermaLemma, CustomLemmatizer, IWNLP]
+
+
 if __name__ == "__main__":
-    main("lemmas", [GermaLemma, CustomLemmatizer, IWNLP])
+    main("lemmas", SYSTEMS)
@@ -0,0 +1,86 @@
+"""
+Manifest of the system outputs under `data/system/` for incremental
+runs of `common.main`, stored in `data/system/.manifest.json`.
+
+For every output file it records the hash of the input file, the
+identity of the system that produced it and the hash of the output
+itself. A job is up to date (and skipped) if all three still match:
+the input is unchanged, the system's class source, `version` and
+output-changing settings are unchanged, and the output has not been
+overwritten since. With `--use-server`, the identity is that of the
+code and settings the server loaded.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+
+from common import file_sha1
+
+
+def system_identity(System, chunk_size=None):
+    """Hash of the source of `System`, its `version` attribute and the
+    settings that change its output: `n_process` (with more than one
+    process the tokenizers work paragraph by paragraph) and the
+    `chunk_size` of streamed runs. Changes to shared code (e.g.
+    common.py) are not tracked, use `--force` after those."""
+    try:
+        source = inspect.getsource(System)
+    except (OSError, TypeError):
+        source = System.__qualname__
+    settings = f"n_process={getattr(System, 'n_process', None)} chunk_size={chunk_size}"
+    identity = (
+        f"{System.__module__}.{System.__qualname__}\n{System.version}\n"
+        f"{settings}\n{source}"
+    )
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    def __init__(self, outdir):
+        self.outdir = outdir
+        # the evaluation scripts only take the directories in `outdir`
+        # for systems
+        self.path = outdir / ".manifest.json"
+        try:
+            with self.path.open(encoding="utf-8") as infile:
+                self.entries = json.load(infile)
+        except FileNotFoundError:
+            self.entries = dict()
+        # hashing the same input for every system only once
+        self.input_hashes = dict()
+
+    def input_hash(self, inputfile):
+        if inputfile not in self.input_hashes:
+            self.input_hashes[inputfile] = file_sha1(inputfile)
+        return self.input_hashes[inputfile]
+
+    def key(self, outpath):
+        return outpath.relative_to(self.outdir).as_posix()
+
+    def is_current(self, outpath, inputfile, identity):
+        entry = self.entries.get(self.key(outpath))
+        return (
+            entry is not None
+            and outpath.exists()
+            and entry["input"] == self.input_hash(inputfile)
+            and entry["system"] == identity
+            and entry["output"] == file_sha1(outpath)
+        )
+
+    def record(self, outpath, inputfile, identity):
+        self.entries[self.key(outpath)] = {
+            "input": self.input_hash(inputfile),
+            "system": identity,
+            "output": file_sha1(outpath),
+        }
+
+    def save(self):
+        # replace the manifest in one step, so that an interrupted run
+        # never leaves it half-written
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmpfile = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with tmpfile.open("w", encoding="utf-8") as outfile:
+            json.dump(self.entries, outfile, indent=1, sort_keys=True)
+        os.replace(tmpfile, self.path)
@@ -0,0 +1,196 @@
+"""
+Keep `TestSystem` models loaded between runs.
+
+`./pos.py --serve` loads the (selected) systems once and answers
+annotation requests on a Unix socket; `./pos.py indir --use-server`
+sends the input files there instead of loading the models itself.
+Messages are length-prefixed JSON. The socket lives in a directory
+only the current user can access and is itself only accessible to
+that user.
+"""
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import tempfile
+
+from common import Timer, TestSystem, doc2string
+from manifest import system_identity
+
+
+def socket_dir():
+    """`$XDG_RUNTIME_DIR`, else a directory of the current user in the
+    temp dir that nobody else can access."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return runtime_dir
+    path = os.path.join(tempfile.gettempdir(), f"konvens2019-{os.getuid()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(f"{path} is not a private directory of this user")
+    return path
+
+
+def default_socket(task):
+    return os.path.join(socket_dir(), f"konvens2019-{task}.sock")
+
+
+def send_msg(sock, obj):
+    data = json.dumps(obj).encode("utf-8")
+    sock.sendall(struct.pack("!I", len(data)) + data)
+
+
+def recv_exactly(sock, size):
+    chunks = list()
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("connection closed by model server")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_msg(sock):
+    (size,) = struct.unpack("!I", recv_exactly(sock, 4))
+    return json.loads(recv_exactly(sock, size).decode("utf-8"))
+
+
+def request(socket_path, obj):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        send_msg(sock, obj)
+        reply = recv_msg(sock)
+    if "error" in reply:
+        raise RuntimeError(f"model server: {reply['error']}")
+    return reply
+
+
+def check_socket(socket_path):
+    """Refuse to replace anything at `socket_path` but the socket of a
+    server that is no longer running."""
+    if not os.path.lexists(socket_path):
+        return
+    if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+        raise RuntimeError(f"{socket_path} exists and is not a socket")
+    try:
+        request(socket_path, {"command": "list"})
+    except ConnectionRefusedError:
+        # left over from a server that was killed
+        os.remove(socket_path)
+    else:
+        raise RuntimeError(f"a model server is already running on {socket_path}")
+
+
+def serve(systems, socket_path):
+    """Load `systems` and answer requests until interrupted.
+    Requests are handled one at a time, since most wrapped models
+    are not thread-safe."""
+    # before loading the models, which takes a while
+    check_socket(socket_path)
+
+    loaded = dict()
+    # taken now, since the source on disk may change while serving
+    identities = dict()
+    for System in systems:
+        sys_name = System.__name__.lower()
+        print(f"Loading {System.__name__}...", file=sys.stderr)
+        identities[sys_name] = system_identity(System)
+        loaded[sys_name] = System()
+        print(
+            f"{System.__name__} loaded in {loaded[sys_name].model_load_time.elapsed:.2f}s",
+            file=sys.stderr,
+        )
+
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            msg = recv_msg(self.request)
+            if msg.get("command") == "list":
+                send_msg(
+                    self.request,
+                    {
+                        "systems": {
+                            name: s.model_load_time.elapsed for name, s in loaded.items()
+                        },
+                        "identities": identities,
+                    },
+                )
+                return
+
+            s = loaded.get(msg.get("system"))
+            if s is None:
+                send_msg(self.request, {"error": f"unknown system {msg.get('system')}"})
+                return
+            try:
+                s.annotate(msg["input"])
+                output = s.data if isinstance(s.data, str) else doc2string(s.data)
+            except Exception as exc:
+                send_msg(self.request, {"error": repr(exc)})
+                raise
+            send_msg(self.request, {"output": output, "times": s.phase_times()})
+
+    # shut down cleanly on `kill` as well as Ctrl-C
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+
+    # no other user may connect; binding fails if another server has
+    # taken the path since `check_socket`
+    old_umask = os.umask(0o177)
+    try:
+        server = socketserver.UnixStreamServer(socket_path, Handler)
+    finally:
+        os.umask(old_umask)
+    os.chmod(socket_path, 0o600)
+    print(f"serving {', '.join(loaded)} on {socket_path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+        for s in loaded.values():
+            s.close()
+
+
+class RemoteSystem(TestSystem):
+    """Stand-in for a system hosted by `serve`. `model_load_time` is
+    the load time reported by the server, not the (zero) load time of
+    this client; `identity` is the `manifest.system_identity` of the
+    code the server runs."""
+
+    def __init__(self, name, socket_path, model_load_time, identity=None):
+        self.name = name
+        self.socket_path = socket_path
+        self.model_load_time = Timer.recorded(model_load_time)
+        self.identity = identity
+
+    def annotate(self, input_data):
+        """`process` and `postprocess` both happen on the server."""
+        reply = request(
+            self.socket_path, {"system": self.name, "input": input_data}
+        )
+        self.data = reply["output"]
+        times = reply["times"]
+        for prefix in ["model_load", "run", "postprocess"]:
+            setattr(self, f"{prefix}_time", Timer.from_dict(times, prefix))
+        return self
+
+
+def remote_systems(socket_path, names=None):
+    """The systems available on the server (optionally only `names`)."""
+    reply = request(socket_path, {"command": "list"})
+    identities = reply.get("identities", {})
+    return [
+        RemoteSystem(name, socket_path, load_time, identities.get(name))
+        for name, load_time in reply["systems"].items()
+        if not names or name in names
+    ]
@@ -7,6 +7,7 @@ import subprocess
 import tempfile
 
 from common import Timer, TestSystem, main
+from common import spacy_array, spacy_lemmas, spacy_pipe, spacy_strings
 from common import Token, Morph, Sentence, rftag2stts, string2doc
 
 CORENLP_HOME = "/opt/stanford-corenlp-full-2018-10-05"
@@ -16,6 +17,8 @@ HIDDEN_FIELDS = ["lemma", "upos", "xpos", "feats", "head", "deprel", "deps"]
 
 
 class StanfordNLP(TestSystem):
+    memory_heavy = True
+
     def __init__(self):
         self.name = "stanfordnlp"
         with Timer() as self.model_load_time:
@@ -32,6 +35,8 @@ class StanfordNLP(TestSystem):
 
 
 class RFTagger(TestSystem):
+    memory_heavy = True
+
     def __init__(self):
         self.home = Path("/opt/RFTagger")
         with Timer() as self.model_load_time:
@@ -139,6 +144,8 @@ class TreeTagger(TestSystem):
 
 
 class RNNTagger(TestSystem):
+    memory_heavy = True
+
     def __init__(self):
         self.home = Path("/opt/RNNTagger")
         with Timer() as self.model_load_time:
@@ -224,6 +231,8 @@ class SoMeWeTa(TestSystem):
 
 
 class CoreNLP(TestSystem):
+    memory_heavy = True
+
     def __init__(self):
         with Timer() as self.model_load_time:
             os.environ["CORENLP_HOME"] = CORENLP_HOME
@@ -249,41 +258,71 @@ class CoreNLP(TestSystem):
             )
 
 
+class WhitespaceTokenizer:
+    """spaCy tokenizer for pretokenized text (tokens separated by spaces)"""
+
+    def __init__(self, vocab):
+        self.vocab = vocab
+
+    def __call__(self, text):
+        from spacy.tokens import Doc
+
+        return Doc(self.vocab, words=text.split())
+
+
 class Spacy(TestSystem):
+    memory_heavy = True
+    # see `main --batch-size/--n-process`
+    batch_size = 256
+    n_process = 1
+
     def __init__(self):
         with Timer() as self.model_load_time:
             # https://spacy.io/usage/linguistic-features#own-annotations
             import spacy
-            from spacy.tokens import Doc
 
             activated = spacy.prefer_gpu()
             print("spaCy using GPU:", activated, file=sys.stderr)
             self.nlp = spacy.load("de_core_news_md", disable=["parser", "ner"])
+            self.nlp.tokenizer = WhitespaceTokenizer(self.nlp.vocab)
 
             def myprocessor(myinput):
-                results = list()
-                # this way we preserve sent boundaries
-                # could also set sent bounds like this: token.is_sent_start = True
-                # but this seems easier
-                for line in myinput.rstrip().split("\n"):
-                    doc = Doc(self.nlp.vocab, words=line.split())
-                    results.append(self.nlp.pipeline[0][1](doc))
-                return results
+                # one doc per line preserves our sent boundaries, and
+                # nlp.pipe tags them in batches
+                return spacy_pipe(
+                    self.nlp,
+                    myinput.rstrip().split("\n"),
+                    self.batch_size,
+                    self.n_process,
+                )
 
             self.processor = myprocessor
 
     def postprocess(self):
+        from spacy.attrs import LEMMA, ORTH, POS, TAG
+
+        arr = spacy_array(self.output_data, [ORTH, TAG, POS, LEMMA])
+        words, xpos, upos = (
+            spacy_strings(arr[:, col], self.nlp.vocab.strings) for col in range(3)
+        )
+        lemmas = spacy_lemmas(self.output_data, arr[:, 3])
         self.data = list()
+        start = 0
+        # one doc per sentence
         for sent_doc in self.output_data:
+            end = start + len(sent_doc)
             self.data.append(
                 Sentence(
-                    Token(word=str(tok), xpos=tok.tag_, upos=tok.pos_, lemma=tok.lemma_)
-                    for tok in sent_doc
+                    Token(word=words[i], xpos=xpos[i], upos=upos[i], lemma=lemmas[i])
+                    for i in range(start, end)
                 )
             )
+            start = end
 
 
 class Clevertagger(TestSystem):
+    memory_heavy = True
+
     def __init__(self):
         with Timer() as self.model_load_time:
             sys.path.insert(0, "/opt/clevertagger-master")
@@ -313,18 +352,21 @@ class UDPipe(TestSystem):
     pass  # TODO
 
 
+SYSTEMS = [
+    StanfordNLP,
+    RFTagger,
+    TreeTagger,
+    RNNTagger,
+    SoMeWeTa,
+    CoreNLP,
+    Clevertagger,
+    Spacy,
+]
+
+
 if __name__ == "__main__":
     main(
         # "tokens",
         "pos",
-        [
-            StanfordNLP,
-            RFTagger,
-            TreeTagger,
-            RNNTagger,
-            SoMeWeTa,
-            CoreNLP,
-            Clevertagger,
-            Spacy,
-        ],
+        SYSTEMS,
     )
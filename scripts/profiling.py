@@ -0,0 +1,110 @@
+"""
+Profiling of `TestSystem` runs (`--profile` of `common.main`).
+
+For every system and input file, `Profile` writes, depending on the
+mode (the two are never combined, so that neither measures the other)
+  - `cprofile`: `<name>.prof`, a deterministic profile (cProfile),
+    e.g. for `python -m pstats` or snakeviz
+  - `sample`: `<name>.folded`, stacks sampled every few ms of CPU
+    time, one `frame;frame;frame count` line per stack, the input
+    format of flamegraph.pl, inferno or speedscope
+"""
+
+import cProfile
+import os
+import signal
+import sys
+import time
+from collections import Counter
+
+
+def frame_label(frame):
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+MODES = ["cprofile", "sample"]
+
+
+class StackSampler:
+    """Samples the stack of the main thread every `interval` seconds of
+    CPU time of the process (Unix only). Time spent waiting for
+    subprocesses does not show up, but blocking (native or JVM) calls
+    are neither interrupted nor sampled while they wait. Stacks start
+    at the `root` frame passed to `start`."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        # CPU time since the last sample, kept across start/stop so
+        # that blocks shorter than the interval still get sampled
+        self.pending = 0.0
+        self.stacks = Counter()
+
+    def sample(self, signum, frame):
+        stack = list()
+        while frame is not None:
+            stack.append(frame_label(frame))
+            if frame is self.root:
+                break
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack))] += 1
+        self.pending = 0.0
+        self.started = time.process_time()
+
+    def start(self, root):
+        self.root = root
+        if hasattr(signal, "setitimer"):
+            self.old_handler = signal.signal(signal.SIGPROF, self.sample)
+            # restart system calls interrupted by the signal
+            signal.siginterrupt(signal.SIGPROF, False)
+            first = max(self.interval - self.pending, 1e-4)
+            self.started = time.process_time()
+            signal.setitimer(signal.ITIMER_PROF, first, self.interval)
+
+    def stop(self):
+        if hasattr(signal, "setitimer"):
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self.old_handler)
+            self.pending += time.process_time() - self.started
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as outfile:
+            for stack, count in self.stacks.most_common():
+                print(stack, count, file=outfile)
+
+
+class Profile:
+    """Profile a `with` block in `mode` (one of MODES), writing
+    `prefix.prof` or `prefix.folded`. Entering the same Profile again
+    adds to its profile."""
+
+    def __init__(self, prefix, mode="cprofile"):
+        if mode not in MODES:
+            raise ValueError(f"unknown profile mode {mode!r}")
+        self.prefix = prefix
+        self.mode = mode
+        if mode == "cprofile":
+            self.profiler = cProfile.Profile()
+        else:
+            self.sampler = StackSampler()
+
+    def __enter__(self):
+        if self.mode == "cprofile":
+            self.profiler.enable()
+        else:
+            self.sampler.start(sys._getframe(1))
+        return self
+
+    def __exit__(self, *args):
+        if self.mode == "cprofile":
+            self.profiler.disable()
+        else:
+            self.sampler.stop()
+
+    def write(self):
+        self.prefix.parent.mkdir(parents=True, exist_ok=True)
+        if self.mode == "cprofile":
+            self.profiler.dump_stats(f"{self.prefix}.prof")
+        else:
+            self.sampler.write(f"{self.prefix}.folded")
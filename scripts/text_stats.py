@@ -5,6 +5,11 @@ Created on 24.06.2019
 '''
 
 import os
+from pathlib import Path
+
+import numpy as np
+
+from columnar import ColumnDocument, Vocab
 
 ###############################
 
@@ -41,74 +46,75 @@ def get_sentences(file):
 
 ##############################
 
-def token_stats(filenames, out="./text_stats.txt"):
-
-    tokens = list()
-    tokens_no_punct = list()
-    lemmas = list()
-    pos = dict()
-
-    tokens_pos = dict()
-    tokens_lemmas = dict()
-
+def first_seen(ids, selected=None):
+    """
+    Input: Array of ids (and optionally a subset of them).
+    Output: The distinct ids in order of their first occurrence.
+    """
+    uniq, first = np.unique(ids, return_index=True)
+    if selected is not None:
+        keep = np.isin(uniq, selected)
+        uniq, first = uniq[keep], first[keep]
+    return uniq[np.argsort(first, kind="stable")]
 
-    outfile = open(out, mode="w", encoding="utf-8")
+##############################
 
-    for filename in filenames:
-        file = import_file(filename)
+def multiple_values(keys, values, vocab_size):
+    """
+    Input: Two id arrays of the same length.
+    Output: The keys that occur with more than one distinct value.
+    """
+    pairs = np.unique(keys.astype(np.int64) * vocab_size + values)
+    pair_keys, counts = np.unique(pairs // vocab_size, return_counts=True)
+    return pair_keys[counts > 1]
 
-        sentences = get_sentences(file)
+##############################
 
-        for sentence in sentences:
+def token_stats(filenames, out="./text_stats.txt"):
 
-            for token in sentence:
-                
-                tokens.append(token[1])
-                if not token[4].startswith("$"): tokens_no_punct.append(token[1])
-                lemmas.append(token[2])
+    # shared by all files, so that their ids can be compared
+    vocab = Vocab()
+    docs = [ColumnDocument(Path(filename), vocab=vocab) for filename in filenames]
+    strings = vocab.table()
 
-                if token[1] in tokens_lemmas:
-                    tokens_lemmas[token[1]].add(token[2])
-                else:
-                    tokens_lemmas[token[1]] = {token[2]}
+    words = np.concatenate([doc.column("word") for doc in docs])
+    lemmas = np.concatenate([doc.column("lemma") for doc in docs])
+    xpos = np.concatenate([doc.column("xpos") for doc in docs])
 
-                if not token[4] in pos:
-                    pos[token[4]] = 1
-                else:
-                    pos[token[4]] += 1
+    is_punct = vocab.table(lambda s: s.startswith("$"), dtype=bool)[xpos]
+    words_no_punct = words[~is_punct]
+    lowercased = vocab.table(str.lower)
 
-                if token[1] in tokens_pos:
-                    tokens_pos[token[1]].add(token[4])
-                else:
-                    tokens_pos[token[1]] = {token[4]}
+    outfile = open(out, mode="w", encoding="utf-8")
 
     #Print for each text and overall
     #tokens
-    print("Tokens:", len(tokens), file=outfile)
+    print("Tokens:", len(words), file=outfile)
     #tokens without punctuation
-    print("Tokens without punctuation:", len(tokens_no_punct), file=outfile)
+    print("Tokens without punctuation:", len(words_no_punct), file=outfile)
     #types
-    print("Types:", len(set(tokens)), file=outfile)
+    print("Types:", len(np.unique(words)), file=outfile)
     #types without punctuation
-    print("Types (without punctuation):", len(set(tokens_no_punct)), file=outfile)
+    print("Types (without punctuation):", len(np.unique(words_no_punct)), file=outfile)
     #types lowercased
-    print("Types lowercased:", len(set([tok.lower() for tok in tokens])), file=outfile)
+    print("Types lowercased:", len(set(lowercased[np.unique(words)])), file=outfile)
     #types lowercased without punctuation
-    print("Types lowercased (without punctuation):", len(set([tok.lower() for tok in tokens_no_punct])), file=outfile)
+    print("Types lowercased (without punctuation):", len(set(lowercased[np.unique(words_no_punct)])), file=outfile)
     #lemmas
-    print("Different lemmas:", len(set(lemmas)), file=outfile)
+    print("Different lemmas:", len(np.unique(lemmas)), file=outfile)
     #tokens with more than 1 lemma
-    toks_mult_lemmas = [tok for tok,lems in tokens_lemmas.items() if len(lems) > 1]
+    toks_mult_lemmas = strings[first_seen(words, multiple_values(words, lemmas, len(vocab)))].tolist()
     print("Tokens with more than one lemma:", len(toks_mult_lemmas), toks_mult_lemmas, file=outfile)
     #pos
+    pos, pos_first, pos_freq = np.unique(xpos, return_index=True, return_counts=True)
     print("POS:", len(pos), file = outfile)
     #tokens with more than 1 pos
-    toks_mult_pos = [tok for tok,pos in tokens_pos.items() if len(pos) > 1]
+    toks_mult_pos = strings[first_seen(words, multiple_values(words, xpos, len(vocab)))].tolist()
     print("Tokens with more than one POS:", len(toks_mult_pos), toks_mult_pos, file=outfile)
     #frequency of pos
     print("POS frequencies:", file=outfile)
-    for p, freq in sorted(pos.items(), key=lambda l: l[1], reverse=True):
-        print("", p, freq, sep="\t", file=outfile)
+    for i in np.lexsort((pos_first, -pos_freq)):
+        print("", strings[pos[i]], pos_freq[i], sep="\t", file=outfile)
     
     #morphology annotations
     #tokens with different morph annotations
@@ -125,4 +131,4 @@ if __name__ == '__main__':
     token_stats([r"C:\Users\Katrin\Desktop\annotations\novelette.conll"], out=r"C:\Users\Katrin\Desktop\novelette_stats.txt")
     token_stats([r"C:\Users\Katrin\Desktop\annotations\opensubtitles.conll"], out=r"C:\Users\Katrin\Desktop\subtitle_stats.txt")    
     token_stats([r"C:\Users\Katrin\Desktop\annotations" + "/"+ p for p in ["wikipedia.conll", "ted.conll", "sermononline.conll", "novelette.conll", "opensubtitles.conll"]], \
-                 out=r"C:\Users\Katrin\Desktop\overall_stats.txt")
\ No newline at end of file
+                 out=r"C:\Users\Katrin\Desktop\overall_stats.txt")
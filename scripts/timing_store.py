@@ -0,0 +1,151 @@
+"""
+SQLite store for timing results (`../eval/timing.db`).
+
+Every invocation of `common.main` is one row in `runs`, holding the
+metadata needed to compare timings across machines and settings (host,
+Python, thread settings, git revision, ...). Its timing rows go to
+`timing`, one transaction per row, so that concurrent or interrupted
+runs never leave partial lines. `eval/timing.csv` holds the timings of
+older runs and is only read.
+"""
+
+import json
+import os
+import platform
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from common import THREAD_VARS, TIMING_COLUMNS, format_cpus
+
+TIMING_DB = Path("../eval/timing.db")
+LEGACY_CSV = Path("../eval/timing.csv")
+
+RUN_SCHEMA = {
+    "run_id": "INTEGER PRIMARY KEY",
+    "exp_exec_time": "INTEGER NOT NULL",
+    "host": "TEXT",
+    "platform": "TEXT",
+    "python": "TEXT",
+    "cpu_count": "INTEGER",
+    "threads": "TEXT",
+    "cpu_affinity": "TEXT",
+    "git_rev": "TEXT",
+    "argv": "TEXT",
+}
+
+TIMING_SCHEMA = {
+    "run_id": "INTEGER NOT NULL REFERENCES runs(run_id)",
+    "system": "TEXT NOT NULL",
+    "domain": "TEXT NOT NULL",
+    "annotation": "TEXT NOT NULL",
+    "sample": "INTEGER",
+    "input_bytes": "INTEGER",
+    **{
+        col: "INTEGER" if col.endswith("_peak_rss") else "REAL"
+        for col in TIMING_COLUMNS
+        if col not in ["system", "domain", "annotation", "exp_exec_time", "sample"]
+    },
+}
+
+
+def git_rev():
+    """Current commit, with `-dirty` if there are uncommitted changes."""
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return rev + "-dirty" if status.strip() else rev
+
+
+def run_metadata(**extra):
+    """Metadata of the current run; `extra` settings (e.g. the number
+    of jobs) are stored with the thread settings."""
+    threads = {
+        var: os.environ[var]
+        for var in THREAD_VARS + ["JAVA_TOOL_OPTIONS"]
+        if var in os.environ
+    }
+    threads.update(extra)
+    return {
+        "exp_exec_time": int(time.time()),
+        "host": socket.gethostname(),
+        "platform": platform.platform(),
+        "python": f"{platform.python_implementation()} {platform.python_version()}",
+        "cpu_count": os.cpu_count(),
+        "threads": json.dumps(threads, sort_keys=True),
+        "cpu_affinity": format_cpus(os.sched_getaffinity(0))
+        if hasattr(os, "sched_getaffinity")
+        else None,
+        "git_rev": git_rev(),
+        "argv": " ".join(sys.argv),
+    }
+
+
+def connect(path=TIMING_DB):
+    """Open the store, creating its tables if needed."""
+    # wait for concurrent writers instead of failing
+    conn = sqlite3.connect(str(path), timeout=60)
+    with conn:
+        for table, schema in [("runs", RUN_SCHEMA), ("timing", TIMING_SCHEMA)]:
+            cols = ", ".join(f"{name} {decl}" for name, decl in schema.items())
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({cols})")
+            # add columns introduced since the store was created
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for name, decl in schema.items():
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+    return conn
+
+
+def insert(conn, table, schema, values):
+    cols = [col for col in schema if col in values]
+    cursor = conn.execute(
+        f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+        [values[col] for col in cols],
+    )
+    return cursor.lastrowid
+
+
+def start_run(conn, metadata):
+    """Record a run and return its id."""
+    with conn:
+        return insert(conn, "runs", RUN_SCHEMA, metadata)
+
+
+def add_row(conn, run_id, row):
+    """Record one timing row (a row dict of `common.run_instance`)."""
+    with conn:
+        insert(conn, "timing", TIMING_SCHEMA, dict(row, run_id=run_id))
+
+
+def load_timing(path=TIMING_DB, legacy_csv=LEGACY_CSV):
+    """All timing rows joined with their run metadata as a DataFrame,
+    including the rows of the legacy csv file (without metadata)."""
+    import pandas as pd
+
+    frames = list()
+    if legacy_csv and Path(legacy_csv).exists():
+        frames.append(
+            pd.read_csv(legacy_csv, sep="\t", header=None, names=TIMING_COLUMNS)
+        )
+    if Path(path).exists():
+        conn = connect(path)
+        frames.append(
+            pd.read_sql_query(
+                "SELECT * FROM timing JOIN runs USING (run_id)", conn
+            )
+        )
+        conn.close()
+    return pd.concat(frames, ignore_index=True, sort=False)
@@ -1,39 +1,72 @@
 #!/usr/bin/env python3
 
 import os
+import re
+import sys
 
-from common import Timer, TestSystem, main
+from common import Timer, TestSystem, main, spacy_pipe
 
 
 CORENLP_HOME = "/opt/stanford-corenlp-full-2018-10-05"
 
 
+def split_paragraphs(text):
+    return [par for par in re.split(r"\n\s*\n", text) if par.strip()]
+
+
 class Spacy(TestSystem):
+    memory_heavy = True
+    # see `main --batch-size/--n-process`
+    batch_size = 64
+    n_process = 1
+
     def __init__(self):
         with Timer() as self.model_load_time:
             import spacy
 
             nlp = spacy.load("de", disable=["tagger", "parser", "ner"])
             nlp.add_pipe(nlp.create_pipe("sentencizer"))
-            self.processor = nlp
+
+            def myprocessor(myinput):
+                # one doc per paragraph instead of one huge doc; lines
+                # may be hard-wrapped within a sentence
+                return spacy_pipe(
+                    nlp, split_paragraphs(myinput), self.batch_size, self.n_process
+                )
+
+            self.processor = myprocessor
 
     def postprocess(self):
         self.data = "\n".join(
-            " ".join(tok.text for tok in sent) for sent in self.output_data.sents
+            " ".join(tok.text for tok in sent)
+            for doc in self.output_data
+            for sent in doc.sents
         )
 
 
 class SpacyDepSents(TestSystem):
+    memory_heavy = True
+    batch_size = 64
+    n_process = 1
+
     def __init__(self):
         with Timer() as self.model_load_time:
             import spacy
 
             nlp = spacy.load("de", disable=["tagger", "ner"])
-            self.processor = nlp
+
+            def myprocessor(myinput):
+                return spacy_pipe(
+                    nlp, split_paragraphs(myinput), self.batch_size, self.n_process
+                )
+
+            self.processor = myprocessor
 
     def postprocess(self):
         self.data = "\n".join(
-            " ".join(tok.text for tok in sent) for sent in self.output_data.sents
+            " ".join(tok.text for tok in sent)
+            for doc in self.output_data
+            for sent in doc.sents
         )
 
 
@@ -62,6 +95,8 @@ class NLTK(TestSystem):
 
 
 class StanfordNLP(TestSystem):
+    memory_heavy = True
+
     def __init__(self):
         with Timer() as self.model_load_time:
             from stanfordnlp import Pipeline
@@ -80,20 +115,71 @@ class StanfordNLP(TestSystem):
         )
 
 
+# the processor of a paragraph worker process
+paragraph_processor = None
+
+
+def init_paragraph_worker(factory):
+    global paragraph_processor
+    paragraph_processor = factory()
+
+
+def process_paragraph(paragraph):
+    return paragraph_processor(paragraph)
+
+
+def parallel_processor(factory, n_process):
+    """Build the processor (text -> list of sentences) returned by
+    `factory` once. With `n_process` > 1, paragraphs (separated by blank
+    lines) are processed on a pool of worker processes with one
+    processor each, and their sentences put back in input order.
+    Returns the processor and the pool (None if there is none), which
+    `TestSystem.close` shuts down."""
+    import multiprocessing
+
+    if n_process <= 1:
+        return factory(), None
+    if multiprocessing.current_process().daemon:
+        # e.g. a `main -j` worker, which can't have child processes
+        print("paragraph workers not available, running serially", file=sys.stderr)
+        return factory(), None
+
+    pool = multiprocessing.Pool(
+        n_process, initializer=init_paragraph_worker, initargs=(factory,)
+    )
+
+    def myprocessor(myinput):
+        results = pool.map(process_paragraph, split_paragraphs(myinput))
+        return [sent for sents in results for sent in sents]
+
+    return myprocessor, pool
+
+
+def syntok_processor():
+    from syntok.tokenizer import Tokenizer
+    import syntok.segmenter as segmenter
+
+    tokenizer = Tokenizer(
+        emit_hyphen_or_underscore_sep=True, replace_not_contraction=False
+    )
+
+    def myprocessor(myinput):
+        # both are generators, consume them here so that the work is
+        # timed as part of `process`
+        return [list(sent) for sent in segmenter.segment(tokenizer.tokenize(myinput))]
+
+    return myprocessor
+
+
 class Syntok(TestSystem):
+    # see `main --n-process`
+    n_process = 1
+
     def __init__(self):
         with Timer() as self.model_load_time:
-            from syntok.tokenizer import Tokenizer
-            import syntok.segmenter as segmenter
-
-            def myprocessor(myinput):
-                tokenizer = Tokenizer(
-                    emit_hyphen_or_underscore_sep=True, replace_not_contraction=False
-                )
-                tokenized = tokenizer.tokenize(myinput)
-                return segmenter.segment(tokenized)
-
-            self.processor = myprocessor
+            self.processor, self.pool = parallel_processor(
+                syntok_processor, self.n_process
+            )
 
     def postprocess(self):
         self.data = "\n".join(
@@ -102,6 +188,8 @@ class Syntok(TestSystem):
 
 
 class CoreNLP(TestSystem):
+    memory_heavy = True
+
     def __init__(self):
         with Timer() as self.model_load_time:
             os.environ["CORENLP_HOME"] = CORENLP_HOME
@@ -122,19 +210,28 @@ class CoreNLP(TestSystem):
         )
 
 
+def somajo_processor():
+    from somajo import Tokenizer, SentenceSplitter
+
+    tokenizer = Tokenizer(language="de")
+    sentsplitter = SentenceSplitter(language="de")
+
+    def myprocessor(myinput):
+        tokenized = tokenizer.tokenize_paragraph(myinput)
+        return sentsplitter.split(tokenized)
+
+    return myprocessor
+
+
 class SoMaJo(TestSystem):
+    # see `main --n-process`
+    n_process = 1
+
     def __init__(self):
         with Timer() as self.model_load_time:
-            from somajo import Tokenizer, SentenceSplitter
-
-            def myprocessor(myinput):
-                tokenizer = Tokenizer(language="de")
-                sentsplitter = SentenceSplitter(language="de")
-                tokenized = tokenizer.tokenize_paragraph(myinput)
-                sentsplit = sentsplitter.split(tokenized)
-                return sentsplit
-
-            self.processor = myprocessor
+            self.processor, self.pool = parallel_processor(
+                somajo_processor, self.n_process
+            )
 
     def postprocess(self):
         """re-format output_data so that it conforms to eval format"""
@@ -171,8 +268,8 @@ class Baseline(TestSystem):
 #         with Timer() as self.model_load_time:
 
 
+SYSTEMS = [Spacy, SpacyDepSents, NLTK, StanfordNLP, Syntok, CoreNLP, SoMaJo, Baseline]
+
+
 if __name__ == "__main__":
-    main(
-        "tokens",
-        [Spacy, SpacyDepSents, NLTK, StanfordNLP, Syntok, CoreNLP, SoMaJo, Baseline],
-    )
+    main("tokens", SYSTEMS)